@@ -0,0 +1,280 @@
+import argparse
+import json
+import logging
+import platform
+import random
+import sys
+import textwrap
+import time
+
+from isolation import Isolation, SearchBoard
+from my_custom_player import CustomPlayer
+
+logger = logging.getLogger(__name__)
+
+CORPUS_SIZE = 50  # number of mid-game positions in the benchmark corpus
+CORPUS_SEED = 0x15014710  # seed of the random games the corpus is sampled from
+MIN_PLY, MAX_PLY = 10, 30  # range of the ply counts of the corpus positions
+NUM_LOOPS = 200  # number of passes over the corpus in each timing of a primitive
+NUM_REPEATS = 20  # number of timings of each benchmark (the fastest one is reported)
+SEARCH_POSITIONS = 20  # number of corpus positions searched by the search benchmarks
+ALPHA_BETA_DEPTH = 7  # depth of the alpha_beta_search() benchmark
+MINIMAX_DEPTH = 4  # depth of the minimax() benchmark
+TOLERANCE = 0.10  # slowdown relative to the baseline reported as a regression
+
+
+def make_corpus(size=CORPUS_SIZE, seed=CORPUS_SEED):
+    """ Return a list of non-terminal mid-game states reached by random games
+
+    The corpus only depends on the size & seed, so every run benchmarks the
+    same positions.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < size:
+        state = Isolation()
+        target_ply = rng.randint(MIN_PLY, MAX_PLY)
+        while state.ply_count < target_ply and not state.terminal_test():
+            state = state.result(rng.choice(state.actions()))
+        if not state.terminal_test():
+            corpus.append(state)
+    return corpus
+
+
+def time_calls(calls, loops=NUM_LOOPS):
+    """ Return the time (in nanoseconds) per call of `loops` passes over the
+    list of (function, args) pairs """
+    start = time.perf_counter_ns()
+    for _ in range(loops):
+        for func, args in calls:
+            func(*args)
+    return (time.perf_counter_ns() - start) / (loops * len(calls))
+
+
+def _make_unmake(board, action):
+    board.make(action)
+    board.unmake()
+
+
+def primitive_calls(corpus):
+    """ Return a dict mapping the name of each primitive benchmark to the list
+    of (function, args) pairs it times """
+    boards = [SearchBoard.from_state(state) for state in corpus]
+    return {
+        "Isolation.actions": [(state.actions, ()) for state in corpus],
+        "Isolation.result": [(state.result, (state.actions()[0],)) for state in corpus],
+        "Isolation.terminal_test": [(state.terminal_test, ()) for state in corpus],
+        "Isolation.liberties": [(state.liberties, (state.locs[state.player()],)) for state in corpus],
+        "Isolation.utility": [(state.utility, (state.player(),)) for state in corpus],
+        "SearchBoard.make/unmake": [(_make_unmake, (board, board.actions()[0])) for board in boards],
+    }
+
+
+def tree_size(state, depth):
+    """ Return the number of nodes of the game tree of state cut off at depth
+    (the number of nodes visited by a minimax search) """
+    if depth <= 0 or state.terminal_test(): return 1
+    return 1 + sum(tree_size(state.result(action), depth - 1) for action in state.actions())
+
+
+def time_search(make_search, corpus):
+    """ Return the time (in nanoseconds) per position of a search of each
+    corpus position, and the number of nodes searched per position
+
+    make_search(state) must return a function that searches the state and
+    returns the number of nodes it visited; it is called before the timer
+    starts, so setting up the search (e.g., creating the player) is not timed.
+    """
+    searches = [make_search(state) for state in corpus]
+    start, nodes = time.perf_counter_ns(), 0
+    for search in searches:
+        nodes += search()
+    return (time.perf_counter_ns() - start) / len(corpus), nodes / len(corpus)
+
+
+def alpha_beta_search(state, depth=ALPHA_BETA_DEPTH):
+    """ Return a function that runs CustomPlayer.alpha_beta_search() on state
+    with an empty transposition table and returns the number of nodes searched """
+    player = CustomPlayer(state.player())
+    player.tt  # allocate the transposition table before the search is timed
+
+    def search():
+        player.alpha_beta_search(state, depth)
+        return player.stats.nodes
+    return search
+
+
+def minimax(state, depth=MINIMAX_DEPTH):
+    """ Return a function that runs CustomPlayer.minimax() on state and returns
+    the number of nodes searched """
+    player = CustomPlayer(state.player())
+    nodes = tree_size(state, depth)
+
+    def search():
+        player.minimax(state, depth)
+        return nodes
+    return search
+
+
+def run_benchmarks(corpus, loops=NUM_LOOPS, repeat=NUM_REPEATS, search_positions=SEARCH_POSITIONS,
+                   alpha_beta_depth=ALPHA_BETA_DEPTH, minimax_depth=MINIMAX_DEPTH):
+    """ Run every benchmark on the corpus and return a dict mapping the name of
+    each benchmark to a dict with its time per operation in nanoseconds
+    ("ns_per_op") and, for the search benchmarks, the number of nodes searched
+    per second ("nodes_per_sec")
+
+    Each benchmark is timed `repeat` times and the fastest timing is reported.
+    The timings of the different benchmarks are interleaved, so that a burst
+    of load on the machine slows down one timing of several benchmarks rather
+    than every timing of one benchmark.
+    """
+    calls = primitive_calls(corpus)
+    positions = corpus[:search_positions]
+    searches = {
+        "CustomPlayer.alpha_beta_search": lambda state: alpha_beta_search(state, alpha_beta_depth),
+        "CustomPlayer.minimax": lambda state: minimax(state, minimax_depth),
+    }
+    best = dict.fromkeys(list(calls) + list(searches), float("inf"))
+    nodes = {}
+    for _ in range(repeat):
+        for name in calls:
+            best[name] = min(best[name], time_calls(calls[name], loops))
+        for name, make_search in searches.items():
+            ns_per_op, nodes[name] = time_search(make_search, positions)
+            best[name] = min(best[name], ns_per_op)
+
+    results = {}
+    for name in calls:
+        results[name] = {"ns_per_op": best[name]}
+        print("{:<32}{:>12.1f} ns/op".format(name, best[name]))
+    for name in searches:
+        results[name] = {"ns_per_op": best[name], "nodes_per_sec": 1e9 * nodes[name] / best[name]}
+        print("{:<32}{:>12.0f} ns/op{:>12.0f} nodes/s".format(
+            name, best[name], results[name]["nodes_per_sec"]))
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """ Print the change of each benchmark relative to the baseline, and return
+    the names of the benchmarks more than `tolerance` slower than the baseline
+
+    Benchmarks missing from either run are reported but never count as
+    regressions.
+    """
+    regressions = []
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            print("{:<32}{:>12}".format(name, "(missing from {})".format(
+                "baseline" if name in results else "results")))
+            continue
+        new, old = results[name]["ns_per_op"], baseline[name]["ns_per_op"]
+        change = new / old - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<32}{:>12.1f} ns/op{:>12.1f} ns/op{:>+9.1%}{}".format(name, old, new, change, flag))
+    return regressions
+
+
+def _config(args):
+    """ Return the settings that must match for two runs to be comparable """
+    return {
+        "corpus_size": args.positions,
+        "seed": args.seed,
+        "search_positions": args.search_positions,
+        "alpha_beta_depth": args.alpha_beta_depth,
+        "minimax_depth": args.minimax_depth,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+
+def main(args):
+    corpus = make_corpus(args.positions, args.seed)
+    results = run_benchmarks(corpus, args.loops, args.repeat, args.search_positions,
+                             args.alpha_beta_depth, args.minimax_depth)
+    config = _config(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2, sort_keys=True)
+        print("Saved baseline to {}".format(args.save))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print("Warning: the baseline was recorded with different settings: {}".format(
+                baseline["config"]))
+        print()
+        print("{:<32}{:>18}{:>18}{:>9}".format("Comparison with " + args.compare, "baseline",
+                                               "current", "change"))
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            logger.warning("Regressions: {}".format(", ".join(regressions)))
+            print("{} benchmark(s) more than {:.0%} slower than the baseline".format(
+                len(regressions), args.tolerance))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Benchmark the Isolation primitives and the CustomPlayer search engines.",
+        epilog=textwrap.dedent("""\
+            Example Usage:
+            --------------
+            - Record a baseline before changing the engine:
+
+                $python benchmark.py -s baseline.json
+
+            - Compare the current engine with the baseline (exits with status 1 if any
+              benchmark is more than 10% slower):
+
+                $python benchmark.py -c baseline.json
+        """)
+    )
+    parser.add_argument(
+        '-n', '--positions', type=int, default=CORPUS_SIZE,
+        help="Set the number of mid-game positions in the benchmark corpus."
+    )
+    parser.add_argument(
+        '--seed', type=int, default=CORPUS_SEED,
+        help="Set the seed of the random games the corpus positions are sampled from."
+    )
+    parser.add_argument(
+        '-l', '--loops', type=int, default=NUM_LOOPS,
+        help="Set the number of passes over the corpus timed for each primitive operation."
+    )
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=NUM_REPEATS,
+        help="Set the number of timings of each benchmark (the fastest timing is reported)."
+    )
+    parser.add_argument(
+        '--search_positions', type=int, default=SEARCH_POSITIONS,
+        help="Set the number of corpus positions searched by the search benchmarks."
+    )
+    parser.add_argument(
+        '--alpha_beta_depth', type=int, default=ALPHA_BETA_DEPTH,
+        help="Set the search depth of the alpha_beta_search() benchmark."
+    )
+    parser.add_argument(
+        '--minimax_depth', type=int, default=MINIMAX_DEPTH,
+        help="Set the search depth of the minimax() benchmark."
+    )
+    parser.add_argument(
+        '-s', '--save', type=str,
+        help="Save the results to a baseline JSON file."
+    )
+    parser.add_argument(
+        '-c', '--compare', type=str,
+        help="Compare the results with a baseline JSON file saved by --save."
+    )
+    parser.add_argument(
+        '-t', '--tolerance', type=float, default=TOLERANCE,
+        help="Set the slowdown relative to the baseline (e.g., 0.1 = 10%%) reported as a regression."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(filename="benchmark.log", filemode="w", level=logging.DEBUG)
+    sys.exit(main(args))
@@ -0,0 +1,124 @@
+import argparse
+import logging
+import os
+import pickle
+import textwrap
+
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
+
+from isolation import Isolation
+from isolation.book import write_book
+from my_custom_player import CustomPlayer
+
+logger = logging.getLogger(__name__)
+
+NUM_PLIES = 4  # number of plies from an empty board covered by the book
+SEARCH_DEPTH = 7  # depth of the search used to choose each book move
+NUM_PROCS = os.cpu_count()
+
+def best_move(state, depth=SEARCH_DEPTH):
+    """ Return the move CustomPlayer chooses in state with an iterative
+    deepening search to the given depth """
+    player = CustomPlayer(state.player())
+    action = None
+    for d in range(1, depth + 1):
+        score, action = player.search(state, d)
+        if abs(score) == float("inf"): break
+    return action
+
+
+def build_book(num_plies=NUM_PLIES, depth=SEARCH_DEPTH, num_processes=NUM_PROCS):
+    """ Return an opening book with the action chosen by CustomPlayer for every
+    state the player can face in the first num_plies plies when it follows the
+    book: every reply of the opponent is covered, but only the book move of the
+    player.
+
+    The book is keyed by Isolation.canonical() keys, and stores each action in
+    the frame of the canonical image of the state, so mirror-image positions
+    are searched & stored once.
+    """
+    book = {}
+    # positions[ply] maps canonical keys to the canonical images of the states
+    # the player must answer at ply
+    positions = defaultdict(dict)
+
+    def add_position(state):
+        key, transform = state.canonical()
+        positions[state.ply_count][key] = state.transform(transform)
+
+    add_position(Isolation())
+    for action in Isolation().actions():
+        add_position(Isolation().result(action))
+    with Pool(num_processes) as pool:
+        for ply in range(num_plies):
+            keys = sorted(positions[ply])
+            states = [positions[ply][key] for key in keys]
+            print("Searching {} positions at ply {}".format(len(states), ply))
+            actions = pool.map(partial(best_move, depth=depth), states)
+            for key, state, action in zip(keys, states, actions):
+                book[key] = action
+                if ply + 2 >= num_plies: continue
+                # the opponent may answer the book move with any legal move
+                child = state.result(action)
+                for reply in child.actions():
+                    next_state = child.result(reply)
+                    if not next_state.terminal_test():
+                        add_position(next_state)
+    return book
+
+
+def main(args):
+    book = build_book(args.plies, args.depth, args.processes)
+    if args.output.endswith(".book"):
+        write_book(book, args.output)
+    else:
+        with open(args.output, "wb") as f:
+            pickle.dump(book, f)
+    logger.info("Saved {} positions to {}".format(len(book), args.output))
+    print("Saved {} positions to {}".format(len(book), args.output))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Build an opening book for CustomPlayer and save it as data.pickle or data.book.",
+        epilog=textwrap.dedent("""\
+            Example Usage:
+            --------------
+            - Build a book for the first 4 plies, choosing moves with a depth 7 search
+              on 4 parallel processes:
+
+                $python build_opening_book.py -n 4 -d 7 -p 4
+
+            - Save a deeper book as a memory-mapped book file, which agents look up in
+              place instead of unpickling it (DataPlayer loads data.book before data.pickle):
+
+                $python build_opening_book.py -n 6 -o data.book
+        """)
+    )
+    parser.add_argument(
+        '-n', '--plies', type=int, default=NUM_PLIES,
+        help="Set the number of plies from an empty board covered by the opening book."
+    )
+    parser.add_argument(
+        '-d', '--depth', type=int, default=SEARCH_DEPTH,
+        help="Set the depth of the search used to choose each move in the book."
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int, default=NUM_PROCS,
+        help="Set the number of parallel processes used to search the book positions."
+    )
+    parser.add_argument(
+        '-o', '--output', type=str, default="data.pickle",
+        help="""\
+            Set the file name of the opening book (CustomPlayer loads data.book or data.pickle);
+            the book is saved in the memory-mapped format of isolation.book if the name ends
+            with .book, and pickled otherwise.
+        """
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(filename="opening_book.log", filemode="w", level=logging.DEBUG)
+    main(args)
@@ -2,25 +2,44 @@
 ###############################################################################
 #                          DO NOT MODIFY THIS FILE                            #
 ###############################################################################
+import atexit
+import ctypes
 import inspect
 import logging
+import pickle
+import random
 import sys
 import textwrap
 import time
+import weakref
 
 from collections import namedtuple
 from enum import Enum
-from multiprocessing import Process, Pipe
+from multiprocessing import Event, Process, Pipe, RawArray, RawValue
 from queue import Empty
 
-from .isolation import Isolation, DebugState
+from .isolation import Isolation, DebugState, SearchBoard
+from .stats import SearchStats, StatsSummary
 
-__all__ = ['Isolation', 'DebugState', 'Status', 'play', 'fork_get_action']
+__all__ = ['Isolation', 'DebugState', 'SearchBoard', 'SearchStats', 'StatsSummary', 'Status',
+           'ActionSlot', 'AgentWorker', 'GameRecord', 'SearchBudget', 'play', 'play_record', 'fork_get_action']
 logger = logging.getLogger(__name__)
 
 Agent = namedtuple("Agent", "agent_class name")
+GameRecord = namedtuple(
+    "GameRecord", "winner loser status initial_state history move_times search_stats match_id")
+
+# Deterministic search budget: when nodes or depth is set, agents are asked to
+# limit their search to that many nodes or plies (see queue.budget) and are not
+# cut off by the time limit; when seed is set, the random module of the agent
+# process is seeded with the seed & the ply count before every move. Agents
+# that ignore the budget are still stopped after timeout seconds (or
+# BUDGET_TIMEOUT if timeout is None), and killed PROCESS_TIMEOUT seconds later.
+SearchBudget = namedtuple("SearchBudget", "nodes depth seed timeout", defaults=(None, None, None, None))
 
 PROCESS_TIMEOUT = 5  # time to interrupt agent search processes (in seconds)
+BUDGET_TIMEOUT = 60  # time to stop the search of a move limited by a budget (in seconds)
+ACTION_SLOT_BYTES = 256  # size of each buffer of an ActionSlot (2 bytes of length & a pickled action)
 GAME_INFO = """\
 Initial game state: {}
 First agent: {!s}
@@ -41,6 +60,7 @@ History: {}
 Winner: {}
 Loser: {}
 """
+MOVE_INFO = "Move {}: {!s} played {} in {:.1f} ms, search stats: {}"
 
 class Status(Enum):
     NORMAL = 0
@@ -53,45 +73,262 @@ class Status(Enum):
 class StopSearch(Exception): pass  # Exception class used to halt search
 
 
+class ActionSlot:
+    """Shared memory slot holding the last action an agent put in its queue
+
+    The action is pickled into one of two buffers, and a sequence number
+    (the number of actions put so far) selects the buffer written last, so a
+    search process killed while writing an action leaves the previous action
+    intact. Putting an action costs a small pickle & a copy, with no system
+    call; the agent context travels separately, once per move (see
+    fork_get_action & AgentWorker).
+    """
+    def __init__(self):
+        self._seq = RawValue(ctypes.c_uint64, 0)
+        self._buffers = RawArray(ctypes.c_char, 2 * ACTION_SLOT_BYTES)
+
+    def clear(self):
+        self._seq.value = 0
+
+    def empty(self):
+        return not self._seq.value
+
+    def put(self, item):
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        if len(data) + 2 > ACTION_SLOT_BYTES:
+            raise ValueError("{!r} does not fit in the action slot".format(item))
+        seq = self._seq.value + 1
+        start = (seq % 2) * ACTION_SLOT_BYTES
+        self._buffers[start:start + len(data) + 2] = len(data).to_bytes(2, "little") + data
+        self._seq.value = seq
+
+    def get(self):
+        """ Return the last action put in the slot
+
+        Raises
+        ------
+        queue.Empty
+            If no action was put in the slot since it was cleared
+        """
+        seq = self._seq.value
+        if not seq: raise Empty
+        start = (seq % 2) * ACTION_SLOT_BYTES
+        size = int.from_bytes(self._buffers[start:start + 2], "little")
+        return pickle.loads(self._buffers[start + 2:start + size + 2])
+
+
 class TimedQueue:
-    """Modified queue class to block .put() after a time limit expires,
-    and to include both a context object & action choice in the queue.
+    """Modified queue class to block .put() after a time limit expires.
+
+    The last action is kept in an ActionSlot shared with the parent process;
+    the context object of the agent is sent to the parent once, when the
+    search is over (see fork_get_action), instead of with every action.
+
+    If the time limit is None (i.e., when the search is limited by the
+    SearchBudget in .budget instead), .put() only raises StopSearch after
+    the timeout of the budget, which is not reported by .time_left().
     """
-    def __init__(self, receiver, sender, time_limit):
-        self.__sender = sender
-        self.__receiver = receiver
-        self.__time_limit = time_limit / 1000
+    def __init__(self, time_limit, budget=None):
+        self.__time_limit = None if time_limit is None else time_limit / 1000
         self.__stop_time = None
+        self.__budget_stop_time = None
+        self.slot = ActionSlot()
         self.agent = None
+        self.budget = budget
 
     def start_timer(self):
-        self.__stop_time = self.__time_limit + time.perf_counter()
+        if self.__time_limit is not None:
+            self.__stop_time = self.__time_limit + time.perf_counter()
+        else:
+            self.__budget_stop_time = _move_timeout(None, self.budget) + time.perf_counter()
+
+    def time_left(self):
+        """ Return the number of seconds before .put() starts raising StopSearch,
+        or None if the timer has not been started """
+        if self.__stop_time is None: return None
+        return self.__stop_time - time.perf_counter()
 
     def put(self, item, block=True, timeout=None):
-        if self.__stop_time and time.perf_counter() > self.__stop_time:
+        stop_time = self.__stop_time or self.__budget_stop_time
+        if stop_time and time.perf_counter() > stop_time:
             raise StopSearch
-        if self.__receiver.poll():
-            self.__receiver.recv()
-        self.__sender.send((getattr(self.agent, "context", None), item))
+        self.slot.put(item)
 
     def put_nowait(self, item):
         self.put(item, block=False)
 
     def get(self, block=True, timeout=None):
-        return self.__receiver.recv()
+        return self.slot.get()
 
     def get_nowait(self):
         return self.get(block=False)
 
-    def qsize(self): return int(self.__receiver.poll())
-    def empty(self): return ~self.__receiver.poll()
-    def full(self): return self.__receiver.poll()
+    def qsize(self): return int(not self.slot.empty())
+    def empty(self): return self.slot.empty()
+    def full(self): return not self.slot.empty()
+
+
+class WorkerQueue:
+    """TimedQueue counterpart used inside AgentWorker processes. Every .put()
+    stores the action choice in the ActionSlot shared with the parent process,
+    and .put() raises StopSearch once the time limit (if any) expires or the
+    parent sets the shared stop signal.
+    """
+    def __init__(self, slot, stop_event):
+        self.__slot = slot
+        self.__stop_event = stop_event
+        self.__stop_time = None
+        self.agent = None
+        self.budget = None
+
+    def start_timer(self, time_limit):
+        self.__stop_time = None if time_limit is None else time_limit / 1000 + time.perf_counter()
+
+    def time_left(self):
+        """ Return the number of seconds before .put() starts raising StopSearch,
+        or None if the timer has not been started """
+        if self.__stop_time is None: return None
+        return self.__stop_time - time.perf_counter()
+
+    def put(self, item, block=True, timeout=None):
+        if self.__stop_event.is_set() or (
+                self.__stop_time is not None and time.perf_counter() > self.__stop_time):
+            raise StopSearch
+        self.__slot.put(item)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+
+_WORKERS = weakref.WeakSet()  # live workers, shut down at interpreter exit
+
+
+class AgentWorker:
+    """Long-lived search process that answers get_action() requests for one
+    agent instance.
+
+    The agent is handed to the worker process once, when the worker starts;
+    each move afterwards only sends the game state over a reusable pipe, so
+    the per-move cost of spawning, pickling and joining a new process
+    disappears. The parent sets a cooperative stop signal when the time limit
+    expires (the next call to queue.put() raises StopSearch), and kills &
+    respawns the worker if it does not finish within PROCESS_TIMEOUT seconds
+    after that.
+
+    Actions are read from an ActionSlot shared with the worker. The context
+    object of the agent stays in the worker between moves, and is sent to
+    the parent once per move, when the search is over; the parent only sends
+    it back if it was replaced by another object. A context object may send
+    an incremental update instead of a copy of itself: if it has a delta()
+    method, the worker sends context.delta() whenever the parent holds a copy
+    of the same context object, and the parent passes it to the
+    apply_delta() method of its copy.
+
+    Workers are not daemonic so that agents may start their own helper
+    processes; call close() (or use the worker as a context manager) when the
+    game is over.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self._conn = None
+        self._process = None
+        self._stop = None
+        self._slot = ActionSlot()
+        self._worker_context = None  # the context object the worker holds a copy of
+        self._spawn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _spawn(self):
+        self._conn, child_conn = Pipe()
+        self._stop = Event()
+        self._process = Process(target=_serve_actions,
+                                args=(self.agent, child_conn, self._slot, self._stop))
+        self._process.start()
+        self._worker_context = self.agent.context
+        child_conn.close()
+        _WORKERS.add(self)
+
+    def restart(self):
+        """ Kill the worker process and start a fresh one for the same agent """
+        if self._process.is_alive(): self._process.terminate()
+        self._process.join()
+        self._conn.close()
+        self._spawn()
+
+    def close(self):
+        """ Shut down the worker process """
+        if self._process is None: return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(timeout=PROCESS_TIMEOUT)
+        if self._process.is_alive(): self._process.terminate()
+        self._conn.close()
+        self._process = None
+        _WORKERS.discard(self)
+
+    def get_action(self, game_state, time_limit, budget=None):
+        """ Run agent.get_action() in the worker process and return the last
+        action the agent put in the queue before the time limit expired
+
+        If time_limit is None, the search is limited by the budget instead
+        (see SearchBudget), and the worker waits for get_action() to return
+        up to the timeout of the budget.
+
+        Raises
+        ------
+        queue.Empty
+            If the agent did not call queue.put() before the time limit expired
+        """
+        self._stop.clear()
+        self._slot.clear()
+        keep_context = self.agent.context is self._worker_context
+        self._conn.send((game_state, keep_context, None if keep_context else self.agent.context,
+                         time_limit, budget))
+        stop_time = time.perf_counter() + _move_timeout(time_limit, budget)
+        kill_time = stop_time + PROCESS_TIMEOUT
+        reply = None
+        while True:
+            now = time.perf_counter()
+            if now >= kill_time:
+                self.restart()
+                break
+            if now >= stop_time: self._stop.set()
+            if not self._conn.poll((stop_time if now < stop_time else kill_time) - now):
+                continue
+            try:
+                reply = self._conn.recv()  # the search finished
+            except EOFError:  # the worker process died during the search
+                self.restart()
+            break
+        if reply is not None:
+            kind, context = reply
+            if kind == "delta":
+                self.agent.context.apply_delta(context)
+            else:
+                self.agent.context = context
+            self._worker_context = self.agent.context
+        return self._slot.get()
+
+
+@atexit.register
+def _close_workers():
+    for worker in list(_WORKERS): worker.close()
 
 
 def play(args): return _play(*args)  # multithreading ThreadPool.map doesn't expand args
 
 
-def _play(agents, game_state, time_limit, match_id, debug=False):
+def play_record(args): return _play_record(*args)
+
+
+def _play(agents, game_state, time_limit, match_id, debug=False, budget=None):
     """ Run a match between two agents by alternately soliciting them to
     select a move and applying it to advance the game state.
 
@@ -107,7 +344,11 @@ def _play(agents, game_state, time_limit, match_id, debug=False):
 
     time_limit : numeric
         The maximum number of milliseconds to allow before timeout during
-        each turn (see notes)
+        each turn (see notes); ignored if the budget limits the nodes or the
+        depth of the search
+
+    budget : SearchBudget (optional)
+        Deterministic search budget and random seed of the agents
 
     Returns
     -------
@@ -116,12 +357,47 @@ def _play(agents, game_state, time_limit, match_id, debug=False):
         were applied to the initial state, a status code describing the
         reason the game ended, and any error information
     """
+    record = _play_record(agents, game_state, time_limit, match_id, debug, budget)
+    return record.winner, record.history, record.match_id
+
+
+def _play_record(agents, game_state, time_limit, match_id, debug=False, budget=None):
+    """ Run a match between two agents (see _play) and return a GameRecord
+    with the winning & losing agents, the Status code describing the reason
+    the game ended, the initial state, the actions applied to the initial
+    state, the time (in milliseconds) each agent took to choose each action,
+    the search stats the agent reported for each action (see SearchStats), and
+    the match id
+    """
     initial_state = game_state
     game_history = []
-    winner = None
-    status = Status.NORMAL
+    move_times = []
+    search_stats = []
+    if budget is not None and (budget.nodes is not None or budget.depth is not None):
+        time_limit = None
     players = [a.agent_class(player_id=i) for i, a in enumerate(agents)]
+    workers = [None, None] if debug else [AgentWorker(p) for p in players]
     logger.info(GAME_INFO.format(initial_state, *agents))
+    try:
+        status, game_state, winner, loser = _play_turns(
+            agents, players, workers, game_state, game_history, move_times, search_stats,
+            time_limit, debug, budget)
+    finally:
+        for worker in workers:
+            if worker is not None: worker.close()
+
+    logger.info(RESULT_INFO.format(status, game_state, game_history, winner, loser))
+    return GameRecord(winner, loser, status, initial_state, game_history, move_times, search_stats,
+                      match_id)
+
+
+def _play_turns(agents, players, workers, game_state, game_history, move_times, search_stats,
+                time_limit, debug, budget):
+    """ Alternate soliciting the active player for a move until the game ends
+    or the active player fails to respond with a legal move, and return the
+    final status & state along with the winner & loser """
+    initial_state = game_state
+    status = Status.NORMAL
     while not game_state.terminal_test():
         active_idx = game_state.player()
 
@@ -129,7 +405,10 @@ def _play(agents, game_state, time_limit, match_id, debug=False):
         winner, loser = agents[1 - active_idx], agents[active_idx]
 
         try:
-            action = fork_get_action(game_state, players[active_idx], time_limit, debug)
+            start_time = time.perf_counter()
+            action = fork_get_action(
+                game_state, players[active_idx], time_limit, debug, workers[active_idx], budget)
+            move_times.append(1000 * (time.perf_counter() - start_time))
         except Empty:
             status = Status.TIMEOUT
             logger.warn(textwrap.dedent("""\
@@ -150,37 +429,61 @@ def _play(agents, game_state, time_limit, match_id, debug=False):
             status = Status.INVALID_MOVE
             break
 
+        stats = getattr(players[active_idx].context, "stats", None)
+        stats = stats.as_dict() if stats is not None else None
+        logger.debug(MOVE_INFO.format(
+            game_state.ply_count, agents[active_idx], action, move_times[-1], stats))
+        search_stats.append(stats)
         game_state = game_state.result(action)
         game_history.append(action)
     else:
         status = Status.GAME_OVER
         if game_state.utility(active_idx) > 0:
             winner, loser = loser, winner  # swap winner/loser if active player won
-
-    logger.info(RESULT_INFO.format(status, game_state, game_history, winner, loser))
-    return winner, game_history, match_id
+    return status, game_state, winner, loser
 
 
-def fork_get_action(game_state, active_player, time_limit, debug=False):
-    receiver, sender = Pipe()
-    action_queue = TimedQueue(receiver, sender, time_limit)
+def fork_get_action(game_state, active_player, time_limit, debug=False, worker=None, budget=None):
+    """ Return the action chosen by active_player in game_state within the
+    time limit (in milliseconds), or within the budget if time_limit is None
+    (see SearchBudget) """
+    if worker is not None:  # reuse the agent's long-lived search process
+        return worker.get_action(game_state, time_limit, budget)
+    action_queue = TimedQueue(time_limit, budget)
     if debug:  # run the search in the main process and thread
         from copy import deepcopy
         active_player.queue = None
-        active_player = deepcopy(active_player)
-        active_player.queue = action_queue
-        _request_action(active_player, action_queue, game_state)
-        time.sleep(time_limit / 1000)
+        agent = deepcopy(active_player)
+        _request_action(agent, action_queue, game_state)
+        if time_limit is not None: time.sleep(time_limit / 1000)
+        active_player.context = agent.context
     else:  # spawn a new process to run the search function
+        receiver, sender = Pipe(duplex=False)
+        p = Process(target=_fork_request_action, args=(active_player, action_queue, game_state, sender))
         try:
-            p = Process(target=_request_action, args=(active_player, action_queue, game_state))
             p.start()
-            p.join(timeout=PROCESS_TIMEOUT + time_limit / 1000)
+            sender.close()
+            kill_time = time.perf_counter() + PROCESS_TIMEOUT + _move_timeout(time_limit, budget)
+            # the context arrives once the search is over (EOF if the process died)
+            if receiver.poll(kill_time - time.perf_counter()):
+                try:
+                    active_player.context = receiver.recv()
+                except EOFError:
+                    pass
+            p.join(timeout=max(0, kill_time - time.perf_counter()))
         finally:
-            if p and p.is_alive(): p.terminate()
-    new_context, action = action_queue.get_nowait()  # raises Empty if agent did not respond
-    active_player.context = new_context
-    return action
+            if p.is_alive(): p.terminate()
+            receiver.close()
+    return action_queue.get_nowait()  # raises Empty if agent did not respond
+
+
+def _move_timeout(time_limit, budget):
+    """ Return the time (in seconds) before the search of a move is stopped:
+    the time limit (in milliseconds), or the timeout of the budget if
+    time_limit is None """
+    if time_limit is not None: return time_limit / 1000
+    timeout = budget.timeout if budget is not None else None
+    return BUDGET_TIMEOUT if timeout is None else timeout
 
 
 def _request_action(agent, queue, game_state):
@@ -189,8 +492,57 @@ def _request_action(agent, queue, game_state):
     """
     agent.queue = queue
     queue.agent = agent
+    _seed_random(queue.budget, game_state)
     try:
         queue.start_timer()
         agent.get_action(game_state)
     except StopSearch:
         pass
+
+
+def _fork_request_action(agent, queue, game_state, conn):
+    """ Run _request_action() in a process spawned by fork_get_action(), and
+    send the context of the agent to the parent once the search is over """
+    try:
+        _request_action(agent, queue, game_state)
+    finally:
+        conn.send(agent.context)
+
+
+def _seed_random(budget, game_state):
+    """ Seed the random module with the seed of the budget (if any) and the
+    ply count, so that every move of a game draws different random numbers """
+    if budget is not None and budget.seed is not None:
+        random.seed("{}:{}".format(budget.seed, game_state.ply_count))
+
+
+def _serve_actions(agent, conn, slot, stop_event):
+    """ Main loop of an AgentWorker process: answer get_action() requests
+    from the parent until the connection is closed.
+    """
+    queue = WorkerQueue(slot, stop_event)
+    agent.queue = queue
+    queue.agent = agent
+    parent_context = agent.context  # the context object the parent holds a copy of
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None: break
+        game_state, keep_context, context, time_limit, queue.budget = request
+        if not keep_context:
+            agent.context = parent_context = context
+        _seed_random(queue.budget, game_state)
+        try:
+            queue.start_timer(time_limit)
+            agent.get_action(game_state)
+        except StopSearch:
+            pass
+        except Exception:
+            logger.exception("Agent {} raised an exception in get_action()".format(agent))
+        if agent.context is parent_context and hasattr(agent.context, "delta"):
+            conn.send(("delta", agent.context.delta()))
+        else:
+            conn.send(("context", agent.context))
+            parent_context = agent.context
@@ -0,0 +1,83 @@
+""" Vectorized evaluation of many Isolation states at once (requires NumPy)
+
+The 115-bit board of each state is split into two uint64 words (bits 0-63
+and bits 64-114), so a batch of N states is an (N, 2) array of words, and
+the mobility of a player is the popcount of the words of the board ANDed with
+the words of the knight-move neighborhood of the player, which are looked up
+in a precomputed (_SIZE + 1, 2) table.
+
+Locations are stored as integers, with -1 for a player who has not been
+placed yet (whose liberties are all the open cells, see Isolation.liberties).
+
+NumPy is an optional dependency of the isolation library; import this module
+only where NumPy is available.
+"""
+import numpy as np
+
+from .isolation import _BLANK_BOARD, _NEIGHBORS
+
+_WORD_MASK = (1 << 64) - 1
+
+# _NEIGHBOR_WORDS[loc] holds the words of _NEIGHBORS[loc]; the extra last row
+# (indexed by loc = -1) holds the words of the blank board
+_NEIGHBOR_WORDS = np.array([(mask & _WORD_MASK, mask >> 64) for mask in _NEIGHBORS + [_BLANK_BOARD]],
+                           dtype=np.uint64)
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    def _popcount(words):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+
+    def _popcount(words):
+        return _BYTE_COUNTS[np.ascontiguousarray(words).view(np.uint8)].sum(axis=-1)
+
+
+def pack_boards(boards):
+    """ Return an (N, 2) uint64 array with the words of a sequence of N
+    bitboards (see Isolation.board) """
+    words = np.empty((len(boards), 2), dtype=np.uint64)
+    words[:, 0] = [board & _WORD_MASK for board in boards]
+    words[:, 1] = [board >> 64 for board in boards]
+    return words
+
+
+def pack_states(states):
+    """ Return the (words, ply_counts, locs) arrays of a sequence of Isolation
+    (or SearchBoard) states
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        The (N, 2) uint64 words of the boards, the (N,) ply counts, and the
+        (N, 2) locations of the players (-1 if a player is not placed)
+    """
+    words = pack_boards([state.board for state in states])
+    ply_counts = np.array([state.ply_count for state in states], dtype=np.int64)
+    # a flat list converts much faster than a list of pairs
+    locs = np.array([-1 if loc is None else loc for state in states for loc in state.locs],
+                    dtype=np.int64).reshape(len(states), 2)
+    return words, ply_counts, locs
+
+
+def mobilities(words, locs):
+    """ Return an (N, 2) array with the number of liberties of each player in
+    each state (see Isolation.both_mobilities)
+
+    Parameters
+    ----------
+    words : numpy.ndarray
+        (N, 2) uint64 words of the boards (see pack_boards)
+
+    locs : numpy.ndarray
+        (N, 2) locations of the players (-1 if a player is not placed)
+    """
+    # (N, 2 players, 2 words) neighborhoods, ANDed with the board of each state
+    open_cells = _NEIGHBOR_WORDS[locs] & words[:, np.newaxis, :]
+    return _popcount(open_cells)
+
+
+def terminal(words, locs):
+    """ Return an (N,) boolean array that is True for the states where either
+    player has no liberties (see Isolation.terminal_test) """
+    return (mobilities(words, locs) == 0).any(axis=1)
@@ -0,0 +1,98 @@
+""" Read-only, memory-mapped opening books
+
+An opening book maps the canonical keys of Isolation states (see
+Isolation.canonical) to actions. The book file holds a fixed-size header and
+one fixed-width record per position, sorted by key: the key as a 17-byte
+big-endian integer (so the byte order of the records is the numeric order of
+the keys), followed by the action as a signed byte. Lookups are binary
+searches over the mapped file, so opening a book reads nothing but the
+header, the pages of the records visited are shared through the page cache by
+every process that maps the same file, and neither the startup time nor the
+memory of a process grows with the size of the book.
+"""
+import mmap
+import os
+import struct
+
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from .isolation import _SIZE
+
+_MAGIC = b"ISOBOOK1"
+_HEADER = struct.Struct(">8sI")  # magic & number of records
+_ACTION = struct.Struct(">b")  # cells (0-114) on an empty board, knight moves (-27 to 27) after
+_KEY_BYTES = (_SIZE + 14 + 7) // 8  # canonical keys hold the board & two 7-bit locations
+_RECORD_BYTES = _KEY_BYTES + 1
+
+_BOOKS = {}  # books opened by this process, by absolute file name
+
+
+class _Keys:
+    """ Sequence view of the keys of the records of a mapped book (as bytes) """
+    def __init__(self, buffer, size):
+        self.buffer = buffer
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start = _HEADER.size + index * _RECORD_BYTES
+        return self.buffer[start:start + _KEY_BYTES]
+
+
+class OpeningBook(Mapping):
+    """Read-only mapping from canonical keys to actions backed by a
+    memory-mapped book file (see write_book)
+
+    Use load_book() to share one OpeningBook per file in each process; a book
+    is pickled by file name, so it is mapped again instead of copied when it
+    is sent to another process.
+    """
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        with open(self.filename, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < _HEADER.size:
+            raise ValueError("{} is not an opening book".format(filename))
+        magic, size = _HEADER.unpack_from(self._buffer)
+        if magic != _MAGIC or len(self._buffer) != _HEADER.size + size * _RECORD_BYTES:
+            raise ValueError("{} is not an opening book".format(filename))
+        self._keys = _Keys(self._buffer, size)
+
+    def __reduce__(self):
+        return load_book, (self.filename,)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for index in range(len(self._keys)):
+            yield int.from_bytes(self._keys[index], "big")
+
+    def __getitem__(self, key):
+        try:
+            target = key.to_bytes(_KEY_BYTES, "big")
+        except (AttributeError, OverflowError):
+            raise KeyError(key)
+        index = bisect_left(self._keys, target)
+        if index == len(self._keys) or self._keys[index] != target:
+            raise KeyError(key)
+        return _ACTION.unpack_from(self._buffer, _HEADER.size + index * _RECORD_BYTES + _KEY_BYTES)[0]
+
+
+def write_book(book, filename):
+    """ Save a dict mapping canonical keys to actions as a book file """
+    with open(filename, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(book)))
+        for key in sorted(book):
+            f.write(key.to_bytes(_KEY_BYTES, "big") + _ACTION.pack(book[key]))
+
+
+def load_book(filename):
+    """ Return the OpeningBook of a book file, mapped once per process """
+    filename = os.path.abspath(filename)
+    if filename not in _BOOKS:
+        _BOOKS[filename] = OpeningBook(filename)
+    return _BOOKS[filename]
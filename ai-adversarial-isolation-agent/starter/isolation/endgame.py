@@ -0,0 +1,182 @@
+""" Endgame analysis for knight's Isolation
+
+Once the two players can no longer reach any common cell, neither player can
+block the other, and the game reduces to two independent longest-path
+problems: the player to move wins if and only if their longest knight path
+through their own region is longer than the opponent's.
+"""
+from .isolation import Action, _MOVES, _NEIGHBORS, _SIZE
+
+ENDGAME_NODE_LIMIT = 20000  # default node budget for the longest path search
+
+_STEPS_UP = [a for a in Action if a > 0]
+_STEPS_DOWN = [-a for a in Action if a < 0]
+
+# Knight moves always change the color of the cell, and because each row of
+# the bitboard has an odd number of bits, the color of a cell is the parity
+# of its index
+_EVEN_CELLS = sum(1 << c for c in range(0, _SIZE, 2))
+_ODD_CELLS = sum(1 << c for c in range(1, _SIZE, 2))
+
+
+class _BudgetExhausted(Exception): pass
+
+
+def reachable(board, loc):
+    """ Return a bitboard of the open cells a knight at `loc` can reach in any
+    number of moves
+
+    Parameters
+    ----------
+    board : int
+        Bitboard of open cells (see Isolation.board)
+
+    loc : int
+        The starting location of the knight
+    """
+    region = 0
+    frontier = board & _NEIGHBORS[loc]
+    while frontier:
+        region |= frontier
+        step = 0
+        for shift in _STEPS_UP: step |= frontier << shift
+        for shift in _STEPS_DOWN: step |= frontier >> shift
+        # steps that wrap around the board land in the (blocked) border bits
+        frontier = step & board & ~region
+    return region
+
+
+def separated(board, loc, other_loc):
+    """ Return True if no open cell a knight at `loc` can reach is reachable by
+    a knight at `other_loc`
+
+    The knight graph is undirected, so the regions of the two knights meet if
+    and only if the region of the first knight contains an open neighbor of
+    the second knight; the flood fill stops as soon as it finds one.
+    """
+    targets = board & _NEIGHBORS[other_loc]
+    region = 0
+    frontier = board & _NEIGHBORS[loc]
+    while frontier:
+        if frontier & targets: return False
+        region |= frontier
+        step = 0
+        for shift in _STEPS_UP: step |= frontier << shift
+        for shift in _STEPS_DOWN: step |= frontier >> shift
+        frontier = step & board & ~region
+    return True
+
+
+def path_bound(board, loc):
+    """ Return an upper bound on the number of moves a knight at `loc` can make
+    on the open cells of `board`
+
+    Every move changes the color of the knight's cell, so a path alternates
+    between cells of the other color and cells of the same color as `loc`.
+    """
+    same, other = (_EVEN_CELLS, _ODD_CELLS) if loc % 2 == 0 else (_ODD_CELLS, _EVEN_CELLS)
+    num_same, num_other = (board & same).bit_count(), (board & other).bit_count()
+    return min(2 * num_other, 2 * num_same + 1)
+
+
+def longest_path(board, loc, limit=ENDGAME_NODE_LIMIT):
+    """ Search for the longest sequence of moves a knight at `loc` can make on
+    the open cells of `board`
+
+    Parameters
+    ----------
+    board : int
+        Bitboard of open cells (usually restricted to reachable(board, loc))
+
+    loc : int
+        The starting location of the knight
+
+    limit : int
+        Maximum number of search nodes; when the budget runs out the search
+        returns the best path found so far as a lower bound
+
+    Returns
+    -------
+    (int, int, Action)
+        A lower & upper bound on the length of the longest path (equal if
+        the search completed) and the first action of the longest path found
+        (None if the knight cannot move)
+    """
+    memo = {}
+    budget = [limit]
+
+    def search(board, loc, bound):
+        key = (loc, board)
+        if key in memo: return memo[key]
+        budget[0] -= 1
+        if budget[0] < 0: raise _BudgetExhausted
+        best = 0
+        targets = _MOVES[loc][board & _NEIGHBORS[loc]][1]
+        # visit the most constrained cells first (Warnsdorff's rule)
+        for target in sorted(targets, key=lambda c: (board & _NEIGHBORS[c]).bit_count()):
+            if best >= bound: break
+            child_board = board ^ (1 << target)
+            best = max(best, 1 + search(child_board, target, path_bound(child_board, target)))
+        memo[key] = best
+        return best
+
+    actions, targets = _MOVES[loc][board & _NEIGHBORS[loc]]
+    upper = path_bound(board, loc)
+    lower, best_action = 0, None
+    try:
+        for action, target in sorted(zip(actions, targets),
+                                     key=lambda m: (board & _NEIGHBORS[m[1]]).bit_count()):
+            if lower >= upper: break
+            child_board = board ^ (1 << target)
+            length = 1 + search(child_board, target, path_bound(child_board, target))
+            if length > lower: lower, best_action = length, action
+    except _BudgetExhausted:
+        if best_action is None: best_action = _greedy_action(board, loc)
+        return max(lower, _greedy_length(board, loc)), upper, best_action
+    return lower, lower, best_action
+
+
+def _greedy_action(board, loc):
+    actions, targets = _MOVES[loc][board & _NEIGHBORS[loc]]
+    if not actions: return None
+    moves = sorted(zip(actions, targets), key=lambda m: (board & _NEIGHBORS[m[1]]).bit_count())
+    return moves[0][0]
+
+
+def _greedy_length(board, loc):
+    """ Return the length of the path found by always moving to the open cell
+    with the fewest onward moves (Warnsdorff's rule) """
+    length = 0
+    action = _greedy_action(board, loc)
+    while action is not None:
+        loc += action
+        board ^= 1 << loc
+        length += 1
+        action = _greedy_action(board, loc)
+    return length
+
+
+def solve_endgame(state, limit=ENDGAME_NODE_LIMIT):
+    """ Return the id of the winning player if the players are separated and
+    the longest path searches settle the winner, otherwise return None
+
+    Parameters
+    ----------
+    state : Isolation or SearchBoard
+        The game state to analyze
+
+    limit : int
+        Node budget for each longest path search
+    """
+    loc0, loc1 = state.locs
+    if loc0 is None or loc1 is None or not separated(state.board, loc0, loc1): return None
+    region0, region1 = reachable(state.board, loc0), reachable(state.board, loc1)
+    active = state.player()
+    own_loc, opp_loc = (loc0, loc1) if active == 0 else (loc1, loc0)
+    own_region, opp_region = (region0, region1) if active == 0 else (region1, region0)
+    own_lower, own_upper, _ = longest_path(own_region, own_loc, limit)
+    opp_lower, opp_upper, _ = longest_path(opp_region, opp_loc, limit)
+    # the active player runs out of moves first unless their path is longer
+    if own_lower > opp_upper: return active
+    if own_upper <= opp_lower: return 1 - active
+    return None
@@ -33,6 +33,58 @@ class Action(IntEnum):
 
 _ACTIONSET = set(Action)  # used for efficient membership testing
 
+# Precompute the knight-move neighborhood of every cell at import time.
+# _NEIGHBORS[loc] is a bitboard of the cells reachable from loc on an empty
+# board, and _MOVES[loc] maps every subset of those cells (i.e., the value of
+# `board & _NEIGHBORS[loc]`) to the (actions, targets) tuples that are open
+_NEIGHBORS = [0] * _SIZE
+_MOVES = [None] * _SIZE
+for _loc in range(_SIZE):
+    _subsets = [(0, (), ())]
+    for _action in Action:
+        _target = _loc + _action
+        if _target < 0 or not _BLANK_BOARD & (1 << _target): continue
+        _subsets += [(mask | (1 << _target), actions + (_action,), targets + (_target,))
+                     for mask, actions, targets in _subsets]
+    _NEIGHBORS[_loc] = _subsets[-1][0]
+    _MOVES[_loc] = {mask: (actions, targets) for mask, actions, targets in _subsets}
+del _loc, _subsets, _action, _target
+
+# Precompute the bit-permutation tables used to mirror states. The board looks
+# the same after mirroring it left-right (transform 1), top-bottom (transform
+# 2), or both (transform 3, a 180 degree rotation); transform 0 is the identity.
+# Mirroring left-right reverses the bits of each row (_REVERSED_ROWS maps every
+# row bitstring to its reverse), and mirroring top-bottom reverses the order of
+# the rows. Every transform is its own inverse.
+_TRANSFORMS = range(4)
+_ROW_MASK = (1 << _WIDTH) - 1
+_ROW_SHIFTS = [y * (_WIDTH + 2) for y in range(_HEIGHT)]
+_REVERSED_ROWS = [int("{:0{}b}".format(_row, _WIDTH)[::-1], 2) for _row in range(1 << _WIDTH)]
+_MIRROR_CELLS = [[None] * _SIZE for _ in _TRANSFORMS]
+for _transform in _TRANSFORMS:
+    for _loc in range(_SIZE):
+        _x, _y = _loc % (_WIDTH + 2), _loc // (_WIDTH + 2)
+        if _x >= _WIDTH: continue
+        if _transform & 1: _x = _WIDTH - 1 - _x
+        if _transform & 2: _y = _HEIGHT - 1 - _y
+        _MIRROR_CELLS[_transform][_loc] = _x + _y * (_WIDTH + 2)
+_CENTER = _SIZE // 2  # the center cell is fixed by every transform
+_MIRROR_ACTIONS = [{_action: Action(_MIRROR_CELLS[_transform][_CENTER + _action] - _CENTER)
+                    for _action in Action} for _transform in _TRANSFORMS]
+del _transform, _loc, _x, _y
+
+
+def _mirror_boards(board):
+    """ Return a list of the mirror images of a bitboard under each transform """
+    rows = [(board >> shift) & _ROW_MASK for shift in _ROW_SHIFTS]
+    reversed_rows = [_REVERSED_ROWS[row] for row in rows]
+    images = [board]
+    for image_rows in (reversed_rows, rows[::-1], reversed_rows[::-1]):
+        image = 0
+        for row, shift in zip(image_rows, _ROW_SHIFTS): image |= row << shift
+        images.append(image)
+    return images
+
 
 class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('locs', int)])):
     """ Bitboard implementation of knight's Isolation game state
@@ -74,7 +126,7 @@ class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('l
         loc = self.locs[self.player()]
         if loc is None:
             return self.liberties(loc)
-        return [a for a in Action if (a + loc) >= 0 and (self.board & (1 << (a + loc)))]
+        return list(_MOVES[loc][self.board & _NEIGHBORS[loc]][0])
 
     def player(self):
         """ Return the id (zero for first player, one for second player) of player
@@ -120,7 +172,10 @@ class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('l
         bool
             True if either player has no legal moves, otherwise False
         """
-        return not (self._has_liberties(0) and self._has_liberties(1))
+        loc0, loc1 = self.locs
+        if loc0 is None or loc1 is None:
+            return not (self._has_liberties(0) and self._has_liberties(1))
+        return not (self.board & _NEIGHBORS[loc0] and self.board & _NEIGHBORS[loc1])
 
     def utility(self, player_id):
         """ Returns the utility of the current game state from the perspective
@@ -165,8 +220,109 @@ class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('l
             A list containing the position of open liberties in the
             neighborhood of the starting position
         """
-        cells = range(_SIZE) if loc is None else (loc + a for a in Action)
-        return [c for c in cells if c >= 0 and self.board & (1 << c)]
+        if loc is None:
+            return [c for c in range(_SIZE) if self.board & (1 << c)]
+        return list(_MOVES[loc][self.board & _NEIGHBORS[loc]][1])
+
+    def mobility(self, player_id):
+        """ Return the number of liberties available to the specified player
+
+        Equivalent to len(self.liberties(self.locs[player_id])), but counts the
+        open cells with a popcount instead of building a list
+
+        Parameters
+        ----------
+        player_id : int
+            The 0-indexed id number of the player
+
+        Returns
+        -------
+        int
+            The number of open cells in the neighborhood of the player
+        """
+        return self.mobility_at(self.locs[player_id])
+
+    def mobility_at(self, loc):
+        """ Return the number of liberties in the neighborhood of `loc`
+
+        See Also
+        -------
+            Isolation.liberties()
+        """
+        if loc is None:
+            return self.board.bit_count()
+        return (self.board & _NEIGHBORS[loc]).bit_count()
+
+    def both_mobilities(self):
+        """ Return a pair with the number of liberties available to each player
+
+        Returns
+        -------
+        tuple
+            (mobility of player 0, mobility of player 1)
+        """
+        loc0, loc1 = self.locs
+        if loc0 is None or loc1 is None:
+            return self.mobility_at(loc0), self.mobility_at(loc1)
+        return (self.board & _NEIGHBORS[loc0]).bit_count(), (self.board & _NEIGHBORS[loc1]).bit_count()
+
+    def canonical(self):
+        """ Return a key shared by all mirror images of the state, and the
+        transform that maps the state onto its canonical image
+
+        The board looks the same after mirroring it left-right, top-bottom, or
+        both, so the four mirror images of a state have the same value; keying
+        lookup tables by the canonical key instead of the state stores each
+        position once.
+
+        Returns
+        -------
+        (int, int)
+            The key of the canonical image (the mirror image with the smallest
+            key) and the transform id (0-3) that produces it from this state
+
+        See Also
+        -------
+            Isolation.transform()
+            Isolation.transform_action()
+
+        Example
+        -------
+        >>> key, transform = state.canonical()
+        >>> book[key] = state.transform_action(action, transform)  # store in the canonical frame
+        >>> action = state.transform_action(book[key], transform)  # map back to this state
+        """
+        loc0, loc1 = self.locs
+        best_key, best_transform = None, 0
+        for transform, key in enumerate(_mirror_boards(self.board)):
+            if loc0 is not None: key |= (_MIRROR_CELLS[transform][loc0] + 1) << _SIZE
+            if loc1 is not None: key |= (_MIRROR_CELLS[transform][loc1] + 1) << (_SIZE + 7)
+            if best_key is None or key < best_key:
+                best_key, best_transform = key, transform
+        return best_key, best_transform
+
+    def transform(self, transform):
+        """ Return the mirror image of the state under the specified transform
+
+        Parameters
+        ----------
+        transform : int
+            0 (identity), 1 (mirror left-right), 2 (mirror top-bottom), or
+            3 (both; a 180 degree rotation)
+        """
+        locs = tuple(None if loc is None else _MIRROR_CELLS[transform][loc] for loc in self.locs)
+        return self.__class__(_mirror_boards(self.board)[transform], self.ply_count, locs)
+
+    def transform_action(self, action, transform):
+        """ Return the image of an action legal in this state under the
+        specified transform (i.e., the equivalent action in the mirrored state)
+
+        Every transform is its own inverse, so this also maps an action from
+        the mirrored state back to this state.
+        """
+        if self.locs[self.player()] is None:
+            return _MIRROR_CELLS[transform][action]
+        return _MIRROR_ACTIONS[transform][action]
 
     def _has_liberties(self, player_id):
         """ Return True if the player has any legal moves in the given state
@@ -175,7 +331,10 @@ class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('l
         -------
             Isolation.liberties()
         """
-        return any(self.liberties(self.locs[player_id]))
+        loc = self.locs[player_id]
+        if loc is None:
+            return any(self.liberties(loc))
+        return bool(self.board & _NEIGHBORS[loc])
 
     def board_size(self):
         """ Return the size of the board
@@ -188,6 +347,82 @@ class Isolation(NamedTuple('Isolation', [('board', int), ('ply_count', int), ('l
         return _SIZE
 
 
+class SearchBoard:
+    """ Mutable counterpart of Isolation for hot search loops
+
+    make(action) applies an action in place and unmake() reverts the last
+    applied action, using a stack that holds the previous location of the
+    moving player, so searching a game tree does not allocate a new state
+    for every node. SearchBoard provides the same query methods as
+    Isolation (actions, player, terminal_test, utility, liberties, mobility,
+    ...), so heuristics written for Isolation states work unchanged.
+
+    Attributes
+    ----------
+    board: int
+        Bitboard representation of the game state (see Isolation.board)
+
+    ply_count: int
+        Cumulative count of the number of actions applied to the board
+
+    locs: list
+        The location of each player (None before the player is placed);
+        updated in place by make() and unmake()
+    """
+    __slots__ = ('board', 'ply_count', 'locs', '_undo')
+
+    def __init__(self, board=_BLANK_BOARD, ply_count=0, locs=(None, None)):
+        self.board = board
+        self.ply_count = ply_count
+        self.locs = list(locs)
+        self._undo = []
+
+    @classmethod
+    def from_state(cls, state):
+        """ Return a SearchBoard with the same contents as an Isolation state """
+        return cls(state.board, state.ply_count, state.locs)
+
+    def to_state(self):
+        """ Return an (immutable) Isolation state with the contents of the board """
+        return Isolation(board=self.board, ply_count=self.ply_count, locs=tuple(self.locs))
+
+    def make(self, action):
+        """ Apply the action for the active player in place
+
+        See Also
+        -------
+            Isolation.result()
+        """
+        player_id = self.ply_count % 2
+        loc = self.locs[player_id]
+        target = action if loc is None else loc + action
+        if not (self.board & (1 << target)):
+            raise RuntimeError("Invalid move: target cell blocked")
+        self._undo.append(loc)
+        self.board ^= 1 << target
+        self.locs[player_id] = target
+        self.ply_count += 1
+
+    def unmake(self):
+        """ Revert the last action applied with make() """
+        self.ply_count -= 1
+        player_id = self.ply_count % 2
+        self.board ^= 1 << self.locs[player_id]
+        self.locs[player_id] = self._undo.pop()
+
+    # the query methods only read the board, ply_count & locs attributes
+    actions = Isolation.actions
+    player = Isolation.player
+    terminal_test = Isolation.terminal_test
+    utility = Isolation.utility
+    liberties = Isolation.liberties
+    mobility = Isolation.mobility
+    mobility_at = Isolation.mobility_at
+    both_mobilities = Isolation.both_mobilities
+    _has_liberties = Isolation._has_liberties
+    board_size = Isolation.board_size
+
+
 class DebugState(Isolation):
     """ Extend the Isolation game state class with utility methods for debugging &
     visualizing the fields in the data structure
@@ -0,0 +1,160 @@
+""" Compact game records & random access replays
+
+A game is encoded as a fixed-size header holding its initial state (the
+115-bit board as 15 little-endian bytes, the ply count, and the locations of
+the players plus one, with 0 for a player who is not placed) followed by one
+signed byte per move: the cell of a placement on the opening move, or the
+Action value of a knight move. An archive of many games is the concatenation
+of their records, each prefixed by its length (2 bytes), so a whole archive
+is one bytes object, and the moves of a game decode in bulk into an array.
+"""
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+import struct
+
+from .isolation import Action, Isolation, _SIZE
+
+CHECKPOINT_INTERVAL = 8  # plies between the boards cached by a Replay
+REPLAY_CACHE_SIZE = 64  # number of Replays cached by a GameArchive
+
+_BOARD_BYTES = (_SIZE + 7) // 8
+_HEADER = struct.Struct("<{}sBBB".format(_BOARD_BYTES))
+_LENGTH = struct.Struct("<H")
+_ACTIONS = {int(action): action for action in Action}
+
+
+def encode_game(initial_state, history):
+    """ Return the record of the game that applied the actions of history to
+    initial_state, as bytes """
+    loc0, loc1 = initial_state.locs
+    header = _HEADER.pack(initial_state.board.to_bytes(_BOARD_BYTES, "little"), initial_state.ply_count,
+                          0 if loc0 is None else loc0 + 1, 0 if loc1 is None else loc1 + 1)
+    return header + array('b', history).tobytes()
+
+
+def decode_header(data):
+    """ Return the initial state in the header of a game record """
+    board, ply_count, loc0, loc1 = _HEADER.unpack_from(data)
+    locs = (None if loc0 == 0 else loc0 - 1, None if loc1 == 0 else loc1 - 1)
+    return Isolation(board=int.from_bytes(board, "little"), ply_count=ply_count, locs=locs)
+
+
+def decode_moves(data):
+    """ Return the moves of a game record as an array of signed bytes """
+    return array('b', data[_HEADER.size:])
+
+
+def decode_game(data):
+    """ Return the (initial_state, history) of a game record; the history
+    holds the cells of placements & the Actions of knight moves, like the
+    history of a GameRecord """
+    initial_state = decode_header(data)
+    history = decode_moves(data).tolist()
+    placed = [loc is not None for loc in initial_state.locs]
+    for index, move in enumerate(history):
+        player_id = (initial_state.ply_count + index) % 2
+        if placed[player_id]:
+            history[index] = _ACTIONS[move]
+        placed[player_id] = True
+    return initial_state, history
+
+
+class Replay:
+    """Random access to the states of one game
+
+    The cell reached by every move is computed once, along with the board
+    every CHECKPOINT_INTERVAL plies, so the state at any ply is rebuilt from
+    the nearest checkpoint by closing at most CHECKPOINT_INTERVAL - 1 cells,
+    without applying the moves that led to it.
+    """
+    def __init__(self, initial_state, history, interval=CHECKPOINT_INTERVAL):
+        self.initial_state = initial_state
+        self.interval = interval
+        self.targets = array('B')
+        self.checkpoints = [initial_state.board]
+        locs = list(initial_state.locs)
+        board = initial_state.board
+        for index, move in enumerate(history):
+            player_id = (initial_state.ply_count + index) % 2
+            target = move if locs[player_id] is None else locs[player_id] + move
+            self.targets.append(target)
+            locs[player_id] = target
+            board &= ~(1 << target)
+            if (index + 1) % interval == 0: self.checkpoints.append(board)
+
+    def __len__(self):
+        """ Return the number of moves of the game """
+        return len(self.targets)
+
+    def state(self, ply):
+        """ Return the Isolation state of the game at the given ply count
+
+        Raises
+        ------
+        IndexError
+            If the game did not reach the ply count
+        """
+        moves = ply - self.initial_state.ply_count
+        if not 0 <= moves <= len(self.targets):
+            raise IndexError("the game did not reach ply {}".format(ply))
+        checkpoint = moves // self.interval
+        board = self.checkpoints[checkpoint]
+        for target in self.targets[checkpoint * self.interval:moves]:
+            board &= ~(1 << target)
+        # the last move of each player is one of the last two moves
+        locs = list(self.initial_state.locs)
+        for index in range(max(0, moves - 2), moves):
+            locs[(self.initial_state.ply_count + index) % 2] = self.targets[index]
+        return Isolation(board=board, ply_count=ply, locs=tuple(locs))
+
+
+class GameArchive(Sequence):
+    """Read-only sequence of the games of an archive (see append_game)
+
+    Indexing an archive returns the (initial_state, history) of a game; the
+    states of the game at any ply are given by state(), through a Replay of
+    the game cached for the last REPLAY_CACHE_SIZE games replayed.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.offsets = array('Q')
+        offset = 0
+        while offset + _LENGTH.size <= len(data):
+            length, = _LENGTH.unpack_from(data, offset)
+            if offset + _LENGTH.size + length > len(data): break  # a record cut short by an interruption
+            self.offsets.append(offset + _LENGTH.size)
+            offset += _LENGTH.size + length
+        self.end = offset  # size of the complete records
+        self.replay = lru_cache(maxsize=REPLAY_CACHE_SIZE)(self._replay)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        return decode_game(self.record(index))
+
+    def record(self, index):
+        """ Return the record of a game """
+        offset = self.offsets[index]
+        length, = _LENGTH.unpack_from(self.data, offset - _LENGTH.size)
+        return self.data[offset:offset + length]
+
+    def _replay(self, index):
+        record = self.record(index)
+        return Replay(decode_header(record), decode_moves(record))
+
+    def state(self, index, ply):
+        """ Return the state of a game at the given ply count """
+        return self.replay(index).state(ply)
+
+
+def append_game(f, initial_state, history):
+    """ Append the record of a game to an archive file open for binary writing """
+    record = encode_game(initial_state, history)
+    f.write(_LENGTH.pack(len(record)) + record)
@@ -0,0 +1,104 @@
+""" Search instrumentation shared by agents, the game loop & run_match
+
+An agent exposes its counters for the current move as the `stats` attribute
+of its context object (see BasePlayer.context); isolation._play logs them
+alongside every move and stores them in the GameRecord of the game.
+"""
+
+
+class SearchStats:
+    """ Counters describing the search an agent ran to choose one move
+
+    Attributes
+    ----------
+    nodes : int
+        Number of positions visited by the search
+
+    leaves : int
+        Number of heuristic evaluations of non-terminal positions
+
+    tt_hits : int
+        Number of positions whose value was read from the transposition table
+        instead of being searched
+
+    cutoffs : list(int)
+        cutoffs[i] is the number of cutoffs caused by the i-th move searched at
+        a node (i.e., the move ordering is good when most are at index 0)
+
+    depth : int
+        Depth of the last iteration completed by an iterative deepening
+        search (0 if no iteration completed)
+
+    iteration_times : list(float)
+        Time (in milliseconds) of each completed iteration
+    """
+    __slots__ = ("nodes", "leaves", "tt_hits", "cutoffs", "depth", "iteration_times")
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.tt_hits = 0
+        self.cutoffs = []
+        self.depth = 0
+        self.iteration_times = []
+
+    def __repr__(self):
+        return "SearchStats({})".format(
+            ", ".join("{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+    def add_cutoff(self, index):
+        """ Count a cutoff caused by the move searched at position index """
+        cutoffs = self.cutoffs
+        while len(cutoffs) <= index: cutoffs.append(0)
+        cutoffs[index] += 1
+
+    def as_dict(self):
+        """ Return the counters as a dict of JSON-serializable values """
+        return {
+            "nodes": self.nodes,
+            "leaves": self.leaves,
+            "tt_hits": self.tt_hits,
+            "cutoffs": list(self.cutoffs),
+            "depth": self.depth,
+            "iteration_times": [round(t, 2) for t in self.iteration_times],
+        }
+
+
+class StatsSummary:
+    """ Aggregate the SearchStats (as dicts, see SearchStats.as_dict) of many
+    moves played by one agent """
+    def __init__(self):
+        self.moves = 0
+        self.searched = 0  # moves with at least one completed search iteration
+        self.nodes = 0
+        self.leaves = 0
+        self.tt_hits = 0
+        self.cutoffs = []
+        self.total_depth = 0
+        self.max_depth = 0
+        self.search_time = 0.  # milliseconds spent in completed iterations
+
+    def add(self, stats):
+        """ Count the stats of one move """
+        self.moves += 1
+        self.nodes += stats["nodes"]
+        self.leaves += stats["leaves"]
+        self.tt_hits += stats["tt_hits"]
+        for index, count in enumerate(stats["cutoffs"]):
+            if index == len(self.cutoffs): self.cutoffs.append(0)
+            self.cutoffs[index] += count
+        self.searched += int(stats["depth"] > 0)
+        self.total_depth += stats["depth"]
+        self.max_depth = max(self.max_depth, stats["depth"])
+        self.search_time += sum(stats["iteration_times"])
+
+    def nodes_per_second(self):
+        return 1000 * self.nodes / self.search_time if self.search_time else 0.
+
+    def __str__(self):
+        cutoffs = sum(self.cutoffs)
+        return ("{} moves ({} searched), depth {:.1f} (max {}), {:.0f} nodes/search, "
+                "{:.0f} nodes/s, {:.1%} TT hits, {:.1%} of cutoffs by the first move").format(
+            self.moves, self.searched, self.total_depth / max(1, self.searched), self.max_depth,
+            self.nodes / max(1, self.searched), self.nodes_per_second(),
+            self.tt_hits / max(1, self.nodes), self.cutoffs[0] / cutoffs if cutoffs else 0.)
@@ -1,3 +1,15 @@
+import ctypes
+import os
+import random
+import time
+import weakref
+
+from functools import lru_cache
+from multiprocessing import Event, Pipe, Process, RawArray
+
+from isolation import SearchBoard, SearchStats
+from isolation.endgame import ENDGAME_NODE_LIMIT, longest_path, reachable, separated, solve_endgame
+from isolation.isolation import _MOVES, _NEIGHBORS
 from sample_players import DataPlayer
 
 # board array dimensions and bitboard size
@@ -5,6 +17,387 @@ _WIDTH = 11
 _HEIGHT = 9
 _SIZE = (_WIDTH + 2) * _HEIGHT - 2
 
+TT_MAX_BYTES = 2**20  # memory cap for the transposition table (in bytes)
+ASPIRATION_WINDOW = 1.0  # half-width of the root search window around the last score
+NULL_WINDOW = 1e-6  # width of the windows used to test if a move beats the best so far
+TIME_MARGIN = 0.005  # seconds reserved to publish the move before the time limit
+ENDGAME_MIN_DEPTH = 2  # only look for separated players at nodes searched at least this deep
+ENDGAME_SEARCH_LIMIT = 500  # longest path search budget inside the game tree search
+_TT_ENTRY_BYTES = 160  # approximate size of one table slot & its entry tuple
+_SHARED_SLOT_WORDS = 3  # 64-bit words per slot of a SharedTranspositionTable
+_MOVE_BIAS = 128  # added to the moves stored in a SharedTranspositionTable (0 stands for None)
+HELPER_POLL_INTERVAL = 1.0  # seconds between checks that the parent of a helper process is alive
+
+# Define heuristics
+# -----------------
+# Each heuristic is a weighted sum of features of the state, computed from the
+# view of the player (own_loc & opp_loc are the locations of the player & the
+# opponent, None before they are placed):
+#   own_moves/opp_moves: the number of liberties of each player
+#   own_moves2/opp_moves2: the number of two-move paths of each player (second
+#       order mobility)
+#   own_center/opp_center: the squared distance of each player to the center
+#   partition: 1 (or -1) if the players are separated and the player (or the
+#       opponent) can reach more cells, 0 otherwise
+# A weight is either a constant, or a (w0, w1) pair for the weight w0 + w1 * t
+# that changes over the game, where t = ply_count / _SIZE is the fraction of
+# the board played. The heuristic of a player is compiled into one function
+# when the player is created (see compile_heuristic), so choosing a heuristic
+# costs nothing at the leaves of the search.
+FEATURES = {
+    "own_moves": "board.bit_count() if own_loc is None else (board & _NEIGHBORS[own_loc]).bit_count()",
+    "opp_moves": "board.bit_count() if opp_loc is None else (board & _NEIGHBORS[opp_loc]).bit_count()",
+    "own_moves2": "_second_order_mobility(board, own_loc)",
+    "opp_moves2": "_second_order_mobility(board, opp_loc)",
+    "own_center": "0 if own_loc is None else _CENTER_DISTANCE[own_loc]",
+    "opp_center": "0 if opp_loc is None else _CENTER_DISTANCE[opp_loc]",
+    "partition": "_partition(board, own_loc, opp_loc)",
+}
+
+HEURISTICS = {
+    # the standard (own_moves - opp_moves) baseline
+    "baseline": {"own_moves": 1, "opp_moves": -1},
+    # puts more weight on taking liberties away from the opponent
+    "offensive": {"own_moves": 0.25, "opp_moves": -0.75},
+    # puts more weight on keeping the player's own liberties
+    "defensive": {"own_moves": 0.75, "opp_moves": -0.25},
+    # a smooth transition from offensive to defensive weights over the game
+    "dynamic": {"own_moves": (0, 1), "opp_moves": (-1, 1)},
+    # the dynamic schedule of the two-move mobility of each player
+    "lookahead": {"own_moves2": (0, 1), "opp_moves2": (-1, 1)},
+    # the dynamic heuristic, staying away from the edges, and favoring won partitions
+    "territory": {"own_moves": (0, 1), "opp_moves": (-1, 1), "own_center": -0.05, "opp_center": 0.05,
+                  "partition": 10},
+}
+HEURISTIC = "dynamic"  # heuristic of CustomPlayer by default
+BATCH_FEATURES = ("own_moves", "opp_moves", "own_center", "opp_center")  # features of score_batch()
+
+_CENTER_DISTANCE = [(c % (_WIDTH + 2) - _WIDTH // 2) ** 2 + (c // (_WIDTH + 2) - _HEIGHT // 2) ** 2
+                    for c in range(_SIZE)]
+
+
+def _second_order_mobility(board, loc):
+    """ Return the number of two-move paths of a knight at loc on the open
+    cells of board (or of one-move paths from every open cell before it is
+    placed) """
+    if loc is None:
+        targets = [cell for cell in range(_SIZE) if board & (1 << cell)]
+    else:
+        targets = _MOVES[loc][board & _NEIGHBORS[loc]][1]
+    return sum((board & _NEIGHBORS[cell]).bit_count() for cell in targets)
+
+
+def _partition(board, loc, other_loc):
+    """ Return the sign of the difference between the number of cells the two
+    knights can reach if they are separated, and 0 otherwise """
+    if loc is None or other_loc is None or not separated(board, loc, other_loc): return 0
+    cells, other_cells = reachable(board, loc).bit_count(), reachable(board, other_loc).bit_count()
+    return (cells > other_cells) - (cells < other_cells)
+
+
+def _weight_code(weight):
+    """ Return the code of a constant or (w0, w1) weight """
+    if not isinstance(weight, tuple): return repr(weight)
+    w0, w1 = weight
+    slope = "t" if w1 == 1 else "{!r} * t".format(w1)
+    return slope if w0 == 0 else "({!r} + {})".format(w0, slope)
+
+
+def compile_heuristic(weights, player_id):
+    """ Return a function that scores a state (an Isolation state or a
+    SearchBoard) for player_id with the weighted sum of features in the dict
+    weights (see HEURISTICS)
+
+    The code of the function computes each feature once, inline, and only
+    the features used by the heuristic; functions are cached by weights &
+    player id.
+
+    Raises
+    ------
+    ValueError
+        If a feature of the heuristic is not defined in FEATURES
+    """
+    for feature in weights:
+        if feature not in FEATURES: raise ValueError("Invalid heuristic feature: {}".format(feature))
+    return _compile_heuristic(tuple(weights.items()), player_id)
+
+
+@lru_cache(maxsize=None)
+def _compile_heuristic(weights, player_id):
+    locs = ("own_loc", "opp_loc") if player_id == 0 else ("opp_loc", "own_loc")
+    lines = ["def evaluate(state):",
+             "    board = state.board",
+             "    {}, {} = state.locs".format(*locs)]
+    if any(isinstance(weight, tuple) for _, weight in weights):
+        lines.append("    t = state.ply_count / {}".format(_SIZE))
+    terms = []
+    for feature, weight in weights:
+        lines.append("    {} = {}".format(feature, FEATURES[feature]))
+        code = _weight_code(weight)
+        terms.append(feature if code == "1" else "-" + feature if code == "-1" else code + " * " + feature)
+    lines.append("    return " + (" + ".join(terms) or "0"))
+    namespace = {"_NEIGHBORS": _NEIGHBORS, "_CENTER_DISTANCE": _CENTER_DISTANCE,
+                 "_second_order_mobility": _second_order_mobility, "_partition": _partition}
+    exec(compile("\n".join(lines), "<heuristic>", "exec"), namespace)
+    return namespace["evaluate"]
+
+
+# Zobrist keys: one random 64-bit key for each open cell, for each player
+# location, and for the second player holding initiative. The key of a state
+# is the XOR of the keys of all its features, so applying an action updates
+# the key with a handful of XORs instead of rehashing the whole state.
+_zobrist_rng = random.Random(0x15014710)
+_ZOBRIST_CELL = [_zobrist_rng.getrandbits(64) for _ in range(_SIZE)]
+_ZOBRIST_LOC = [[_zobrist_rng.getrandbits(64) for _ in range(_SIZE)] for _ in range(2)]
+_ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+del _zobrist_rng
+
+
+def zobrist_key(state):
+    """ Return the Zobrist key of an Isolation state """
+    key = _ZOBRIST_SIDE if state.player() else 0
+    for cell in range(_SIZE):
+        if state.board & (1 << cell): key ^= _ZOBRIST_CELL[cell]
+    for player_id, loc in enumerate(state.locs):
+        if loc is not None: key ^= _ZOBRIST_LOC[player_id][loc]
+    return key
+
+
+def zobrist_child_key(key, state, action):
+    """ Return the Zobrist key of state.result(action) given the key of state """
+    player_id = state.player()
+    loc = state.locs[player_id]
+    target = action if loc is None else loc + action
+    key ^= _ZOBRIST_CELL[target] ^ _ZOBRIST_LOC[player_id][target] ^ _ZOBRIST_SIDE
+    if loc is not None: key ^= _ZOBRIST_LOC[player_id][loc]
+    return key
+
+
+class SearchTimeout(Exception): pass  # raised to abandon a search at the deadline
+
+
+class TranspositionTable:
+    """Fixed-size transposition table indexed by the low bits of a Zobrist key
+
+    Each slot holds one (key, depth, value, bound, move, age) entry. The age is
+    advanced once per move by new_search(); a new entry replaces the stored one
+    if the stored entry is left over from an earlier move, or if the new entry
+    was searched at least as deep (depth-preferred replacement).
+
+    Values are always stored from the perspective of the searching player.
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, max_bytes=TT_MAX_BYTES):
+        size = 1
+        while 2 * size * _TT_ENTRY_BYTES <= max_bytes: size *= 2
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.age = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def new_search(self):
+        """ Mark all stored entries as left over from an earlier search """
+        self.age += 1
+
+    def lookup(self, key, depth, alpha, beta):
+        """ Return a (value, move) pair for the position with the given key
+
+        The value is None unless the stored entry was searched at least `depth`
+        plies deep and its bound settles the search window (alpha, beta); the
+        move is the best move stored for the position (or None).
+        """
+        entry = self.slots[key & self.mask]
+        if entry is None or entry[0] != key:
+            return None, None
+        _, entry_depth, value, bound, move, _ = entry
+        if entry_depth >= depth and (bound == self.EXACT
+                                     or (bound == self.LOWER and value >= beta)
+                                     or (bound == self.UPPER and value <= alpha)):
+            return value, move
+        return None, move
+
+    def store(self, key, depth, value, bound, move):
+        """ Store the value (EXACT, LOWER or UPPER bound) of a search of the
+        position with the given key """
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is None or entry[5] != self.age or depth >= entry[1]:
+            self.slots[index] = (key, depth, value, bound, move, self.age)
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """TranspositionTable stored in shared memory, so that the helper
+    processes of a parallel search (see LazySMP) read & write the same entries
+
+    Each slot holds three 64-bit words: the key XORed with the two other
+    words, the value (a double), and the depth, bound, move & age packed into
+    one word. Processes read & write the slots without locking: a slot read
+    while another process overwrites it fails the XOR check against the key,
+    and reads as empty. A table attached to the buffer of another table
+    (i.e., in a helper process) shares its entries, but not its age.
+    """
+    def __init__(self, max_bytes=TT_MAX_BYTES, buffer=None):
+        if buffer is None:
+            size = 1
+            while 2 * size * 8 * _SHARED_SLOT_WORDS <= max_bytes: size *= 2
+            buffer = RawArray(ctypes.c_uint64, _SHARED_SLOT_WORDS * size)
+        self.buffer = buffer
+        self.words = memoryview(buffer).cast("B").cast("Q")
+        self.values = memoryview(buffer).cast("B").cast("d")
+        self.mask = len(self.words) // _SHARED_SLOT_WORDS - 1
+        self.age = 0
+
+    def __len__(self):
+        return self.mask + 1
+
+    def __getstate__(self):
+        raise TypeError("a SharedTranspositionTable is attached to its process, pass its buffer instead")
+
+    def entry(self, key):
+        """ Return the (depth, value, bound, move) entry stored for the
+        position with the given key, or None """
+        index = _SHARED_SLOT_WORDS * (key & self.mask)
+        words = self.words
+        # read the value before its bits, so that a value overwritten after it
+        # was read changes the bits & fails the check
+        check, value, bits, data = words[index], self.values[index + 1], words[index + 1], words[index + 2]
+        if check ^ bits ^ data != key:
+            return None
+        move = data >> 16 & 0xffff
+        return data & 0xff, value, data >> 8 & 0xff, move - _MOVE_BIAS if move else None
+
+    def lookup(self, key, depth, alpha, beta):
+        entry = self.entry(key)
+        if entry is None:
+            return None, None
+        entry_depth, value, bound, move = entry
+        if entry_depth >= depth and (bound == self.EXACT
+                                     or (bound == self.LOWER and value >= beta)
+                                     or (bound == self.UPPER and value <= alpha)):
+            return value, move
+        return None, move
+
+    def store(self, key, depth, value, bound, move):
+        index = _SHARED_SLOT_WORDS * (key & self.mask)
+        words = self.words
+        data = words[index + 2]
+        if data >> 32 != self.age or depth >= data & 0xff:
+            data = depth | bound << 8 | (0 if move is None else move + _MOVE_BIAS) << 16 | self.age << 32
+            self.values[index + 1] = value
+            words[index + 2] = data
+            words[index] = key ^ words[index + 1] ^ data
+
+
+class LazySMP:
+    """Helper processes searching the same root position as the main search
+    process (Lazy SMP), and sharing its transposition table in shared memory
+
+    The helpers run the same iterative deepening search as the main process,
+    starting from alternate depths so that they do not search in lockstep,
+    and store their results in the shared table (self.tt); the main process
+    skips the positions the helpers already searched, and publishes the move
+    of the deepest search completed by any process. The helpers only stop
+    deepening when the main process sets the stop signal, or at the deadline
+    of the move (e.g., if the main process was killed). They are started by
+    the first search, and shut down when the LazySMP is garbage collected.
+    """
+    def __init__(self, player, num_helpers):
+        self.player = player
+        self.num_helpers = num_helpers
+        self.tt = SharedTranspositionTable(player.tt_max_bytes)
+        self.stop_signal = Event()
+        self.conns = []
+        self.processes = []
+        weakref.finalize(self, LazySMP._shutdown, os.getpid(), self.conns, self.processes)
+
+    def start(self, state, time_left):
+        """ Ask every helper to search state for time_left seconds (or until
+        the stop signal if time_left is None) """
+        if not self.processes:
+            for index in range(self.num_helpers):
+                conn, child_conn = Pipe()
+                process = Process(target=_serve_helper, daemon=True, args=(
+                    self.player, child_conn, self.tt.buffer, self.stop_signal, index, os.getpid()))
+                process.start()
+                child_conn.close()
+                self.conns.append(conn)
+                self.processes.append(process)
+        self.stop_signal.clear()
+        for conn in self.conns:
+            conn.send((state, time_left, self.tt.age))
+
+    def stop(self):
+        """ Stop the searches of the helpers """
+        self.stop_signal.set()
+
+    @staticmethod
+    def _shutdown(pid, conns, processes):
+        if os.getpid() != pid: return  # a copy of the LazySMP in a forked process
+        for conn in conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for process in processes:
+            process.join(timeout=HELPER_POLL_INTERVAL)
+            if process.is_alive(): process.terminate()
+
+
+class _HelperQueue:
+    """ Queue of the player of a helper process, which never publishes moves """
+    def put(self, item, block=True, timeout=None): pass
+
+
+def _serve_helper(player, conn, buffer, stop_signal, index, parent_pid):
+    """ Main loop of a LazySMP helper process: search the states sent by the
+    main process until the connection is closed or the parent process dies """
+    tt = SharedTranspositionTable(buffer=buffer)
+    player.helpers = 0
+    player.queue = _HelperQueue()
+    player.context = SearchContext(tt)
+    player.stop_signal = stop_signal
+    while True:
+        if not conn.poll(HELPER_POLL_INTERVAL):
+            if os.getppid() != parent_pid: break
+            continue
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None: break
+        state, time_left, tt.age = request
+        player.search_context.stats = SearchStats()
+        player.killers = []
+        player.history = [[0] * _SIZE, [0] * _SIZE]
+        player.deadline = float("inf") if time_left is None else time.perf_counter() + time_left
+        try:
+            player.iterative_deepening(state, first_depth=2 - index % 2, stop_early=False)
+        except SearchTimeout:
+            pass
+
+
+class SearchContext:
+    """Context carried between moves: the transposition table and the
+    SearchStats of the last move (read by isolation._play and run_match)
+    """
+    def __init__(self, tt):
+        self.tt = tt
+        self.stats = SearchStats()
+
+    def delta(self):
+        """ Return the update of a copy of the context held by the parent of
+        an AgentWorker process (see isolation.AgentWorker): the table stays
+        in the worker between moves, so only the stats are sent """
+        return self.stats
+
+    def apply_delta(self, stats):
+        self.stats = stats
+
+
 class CustomPlayer(DataPlayer):
     """Implement your own agent to play knight's Isolation
 
@@ -22,6 +415,71 @@ class CustomPlayer(DataPlayer):
       any pickleable object to the self.context attribute.
     **********************************************************************
     """
+    def __init__(self, player_id, tt_max_bytes=TT_MAX_BYTES, aspiration_window=ASPIRATION_WINDOW,
+                 pvs=True, depth_limit=None, endgame=True, node_limit=None, helpers=0,
+                 heuristic=HEURISTIC):
+        super().__init__(player_id)
+        # the name of a heuristic in HEURISTICS, or a dict of feature weights
+        if isinstance(heuristic, str) and heuristic not in HEURISTICS:
+            raise ValueError("Invalid heuristic: {}".format(heuristic))
+        self.heuristic = heuristic
+        self.weights = HEURISTICS[heuristic] if isinstance(heuristic, str) else dict(heuristic)
+        self.evaluate = compile_heuristic(self.weights, player_id)
+        self.tt_max_bytes = tt_max_bytes
+        self.aspiration_window = aspiration_window
+        self.pvs = pvs
+        self.depth_limit = depth_limit
+        self.node_limit = node_limit
+        self.endgame = endgame
+        self.helpers = helpers
+        self.killers = []
+        self.history = [[0] * _SIZE, [0] * _SIZE]
+        self.deadline = float("inf")
+        self.max_nodes = float("inf")
+        self.stop_signal = None
+        self._smp = None
+
+    def __getstate__(self):
+        # the helper processes of a parallel search belong to the process
+        # that started them
+        state = self.__dict__.copy()
+        state["_smp"] = None
+        # compiled heuristics are not pickleable, and are compiled again
+        del state["evaluate"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.evaluate = compile_heuristic(self.weights, self.player_id)
+
+    @property
+    def search_context(self):
+        """ Return the SearchContext carried between moves in self.context """
+        if not isinstance(self.context, SearchContext):
+            tt = None if self.helpers else TranspositionTable(self.tt_max_bytes)
+            self.context = SearchContext(tt)
+        return self.context
+
+    @property
+    def smp(self):
+        """ Return the LazySMP helpers of the parallel search (see self.helpers) """
+        if self._smp is None:
+            self._smp = LazySMP(self, self.helpers)
+        return self._smp
+
+    @property
+    def tt(self):
+        """ Return the transposition table carried between moves in
+        self.context, or the table shared with the helper processes of the
+        parallel search, which stays in the process of the player """
+        if self.helpers:
+            return self.smp.tt
+        return self.search_context.tt
+
+    @property
+    def stats(self):
+        """ Return the SearchStats of the current move """
+        return self.search_context.stats
 
     def get_action(self, state):
         """Employ an adversarial search technique to choose an action
@@ -40,23 +498,186 @@ class CustomPlayer(DataPlayer):
           Refer to (and use!) the Isolation.play() function to run games.
         **********************************************************************
         """
-
-        import random
-
-        depth_limit = 5
-        if state.ply_count < 2:
+        self.search_context.stats = SearchStats()
+        book_action = self.book_action(state)
+        if book_action is not None:
+            self.queue.put(book_action)
+        elif state.ply_count < 2:
             # Randomly select a move as player 1 or 2 on an empty board
             self.queue.put(random.choice(state.actions()))
-        else:
-            # Return the optimal minimax move.
-            #
-            # Use a for loop for iterative deepening. Iterative deepening is a search
-            # technique that allows minimax-style search functions to return an
-            # approximate solution when computational resources are bounded. The basic
-            # idea is to start with a small depth-limited search, and grow the depth
-            # limit until the resource limit (usually search time) expires.
-            for depth in range(1, depth_limit+1):
-                self.queue.put(self.alpha_beta_search(state, depth))
+        elif not (self.endgame and self.play_endgame(state)):
+            self.tt.new_search()
+            self.killers = []
+            self.history = [[0] * _SIZE, [0] * _SIZE]
+            # Stop searching a little before the time limit so the last
+            # completed iteration is always published; without a timer, keep
+            # deepening until the caller cuts off the search (or until the
+            # node or depth budget of the caller runs out)
+            time_left = getattr(self.queue, "time_left", lambda: None)()
+            if time_left is None:
+                self.deadline = float("inf")
+            else:
+                self.deadline = time.perf_counter() + time_left - TIME_MARGIN
+            budget = getattr(self.queue, "budget", None)
+            node_limits = [self.node_limit, budget and budget.nodes]
+            depth_limits = [self.depth_limit, budget and budget.depth]
+            self.max_nodes = min((n for n in node_limits if n), default=float("inf"))
+            depth_limit = min((d for d in depth_limits if d), default=None)
+            # a node or depth budget must give reproducible searches, so the
+            # helpers only search under a time limit
+            if self.helpers and not (budget and (budget.nodes or budget.depth)):
+                self.parallel_search(state, time_left, depth_limit)
+            else:
+                try:
+                    self.iterative_deepening(state, depth_limit)
+                except SearchTimeout:
+                    pass
+
+    def parallel_search(self, state, time_left, depth_limit=None):
+        """Run iterative_deepening() alongside the self.helpers processes of
+        the LazySMP, which search the same state until this search is over
+
+        The search keeps deepening until the deadline instead of stopping at
+        an iteration predicted to overrun it, since the helpers may complete
+        the iteration first; the move of the deepest search completed by any
+        process is published before the helpers are stopped, if it is legal.
+        """
+        smp = self.smp
+        smp.start(state, None if time_left is None else time_left - TIME_MARGIN)
+        try:
+            try:
+                self.iterative_deepening(state, depth_limit, stop_early=False)
+            except SearchTimeout:
+                pass
+            entry = self.tt.entry(zobrist_key(state))
+            if entry is not None:
+                depth, value, bound, move = entry
+                # the lock-free table may return the move of another state
+                # (torn write or key collision): keep this search's move then
+                actions = state.actions()
+                if (depth > self.stats.depth and bound == self.tt.EXACT and move in actions
+                        and value != float("-inf")):
+                    self.stats.depth = depth
+                    self.queue.put(actions[actions.index(move)])
+        finally:
+            smp.stop()
+
+    def book_action(self, state):
+        """Return the opening book move for state, or None if the state is not
+        in the book (see build_opening_book.py). The book (a dict, or an
+        OpeningBook mapped from data.book) maps the canonical key of each
+        state to the action in the frame of its canonical image.
+        """
+        if self.data is None:
+            return None
+        key, transform = state.canonical()
+        action = self.data.get(key)
+        if action is None:
+            return None
+        return state.transform_action(action, transform)
+
+    def play_endgame(self, state):
+        """Play the first move of the longest path through the active
+        player's region if the players are separated, and return True; return
+        False (without calling self.queue.put) if the players can still meet.
+
+        Once neither player can reach a cell the opponent can reach, the
+        opponent's moves no longer matter, so the longest path search replaces
+        the adversarial search. A cheap search publishes a move quickly before
+        a search with the full ENDGAME_NODE_LIMIT budget refines it.
+        """
+        own_loc, opp_loc = state.locs[self.player_id], state.locs[1 - self.player_id]
+        if not separated(state.board, own_loc, opp_loc):
+            return False
+        region = reachable(state.board, own_loc)
+        lower, upper, action = longest_path(region, own_loc, ENDGAME_SEARCH_LIMIT)
+        self.queue.put(action if action is not None else random.choice(state.actions()))
+        if lower < upper:
+            _, _, action = longest_path(region, own_loc, ENDGAME_NODE_LIMIT)
+            if action is not None: self.queue.put(action)
+        return True
+
+    def endgame_value(self, state):
+        """Return the exact value (+/- infinity) of a state where the players
+        are separated and the longest path searches settle the winner within
+        ENDGAME_SEARCH_LIMIT nodes, otherwise return None.
+        """
+        winner = solve_endgame(state, ENDGAME_SEARCH_LIMIT)
+        if winner is None:
+            return None
+        return float("inf") if winner == self.player_id else float("-inf")
+
+    def iterative_deepening(self, state, depth_limit=None, first_depth=1, stop_early=True):
+        """Return the optimal minimax move.
+
+        Use a for loop for iterative deepening. Iterative deepening is a search
+        technique that allows minimax-style search functions to return an
+        approximate solution when computational resources are bounded. The basic
+        idea is to start with a small depth-limited search, and grow the depth
+        limit until the resource limit (usually search time) expires.
+
+        The iterations start from first_depth (the helpers of a parallel search
+        start from alternate depths). Each iteration searches a window around
+        the score of the previous iteration, whose principal variation is
+        searched first through the best moves stored in the transposition
+        table. Deepening stops when the score proves a win or a loss (a proven
+        loss does not replace the move of the previous iteration), when
+        depth_limit (or self.depth_limit) is reached, or (if stop_early is set)
+        when the predicted cost of the next iteration (the time or the nodes of
+        the last iteration times the effective branching factor) exceeds the
+        time left before self.deadline or the nodes left before
+        self.max_nodes. The depth & time of each completed iteration are
+        recorded in self.stats before its move is published.
+        """
+        stats = self.stats
+        # no game outlasts the open cells
+        depth_limit = depth_limit or self.depth_limit or state.board.bit_count()
+        branching = len(state.actions())
+        score = None
+        last_nodes = None
+        for depth in range(first_depth, depth_limit + 1):
+            start_time, start_nodes = time.perf_counter(), stats.nodes
+            score, action = self.aspiration_search(state, depth, score)
+            if score == float("-inf") and depth > first_depth:
+                # every move loses against perfect play; keep the move of the
+                # last unproven iteration, which is best against a fallible one
+                break
+            now, nodes = time.perf_counter(), stats.nodes - start_nodes
+            stats.depth = depth
+            stats.iteration_times.append(1000 * (now - start_time))
+            self.queue.put(action)
+            if score == float("inf"):
+                break  # the search found a forced win
+            if last_nodes:
+                branching = max(1, nodes / last_nodes)
+            if stop_early and now + (now - start_time) * branching > self.deadline:
+                break
+            if stop_early and stats.nodes + nodes * branching > self.max_nodes:
+                break
+            last_nodes = nodes
+
+    def search_expired(self):
+        """ Return True once the search must stop: when the node budget or the
+        time runs out, or when the stop signal of a helper process is set """
+        return (self.stats.nodes > self.max_nodes or time.perf_counter() > self.deadline
+                or (self.stop_signal is not None and self.stop_signal.is_set()))
+
+    def aspiration_search(self, state, depth, guess=None):
+        """Search state with a window of self.aspiration_window around the
+        guessed score, and re-search with the failing side of the window
+        opened up if the score falls outside it. Return a (score, move) pair.
+        """
+        alpha, beta = float("-inf"), float("inf")
+        if guess is not None and self.aspiration_window and abs(guess) != float("inf"):
+            alpha, beta = guess - self.aspiration_window, guess + self.aspiration_window
+        while True:
+            score, action = self.search(state, depth, alpha, beta)
+            if score <= alpha and alpha != float("-inf"):
+                alpha = float("-inf")
+            elif score >= beta and beta != float("inf"):
+                beta = float("inf")
+            else:
+                return score, action
 
     def alpha_beta_search(self, state, depth):
         """Return the move along a branch of the game tree that
@@ -67,96 +688,219 @@ class CustomPlayer(DataPlayer):
         You can ignore the special case of calling this function
         from a terminal state.
         """
-        
-        def min_value(state, alpha, beta, depth):
+        return self.search(state, depth)[1]
+
+    def search(self, state, depth, alpha=float("-inf"), beta=float("inf")):
+        """Run a fail-soft alpha-beta search of state within the window
+        (alpha, beta) and return a (score, move) pair. The score is an upper
+        bound if it is <= alpha, and a lower bound if it is >= beta.
+
+        The search applies and reverts actions in place on a SearchBoard
+        instead of allocating a new Isolation state for every node. Positions
+        are cached in the transposition table (self.tt), keyed by
+        their Zobrist key, so positions reached through different move orders
+        or searched by an earlier iteration are not searched again. When
+        self.pvs is set, every child after the first is searched with a
+        NULL_WINDOW-wide window first (principal variation search), and only
+        re-searched with the full window if it might improve on the best child
+        found so far. When self.endgame is set, nodes searched at least
+        ENDGAME_MIN_DEPTH deep where the players are separated are scored
+        exactly by the longest path searches of endgame_value(). Nodes, leaf
+        evaluations, table hits and the index of the move causing each cutoff
+        are counted in self.stats.
+        """
+        tt = self.tt
+        stats = self.stats
+        pvs = self.pvs
+        endgame = self.endgame
+        # call the compiled heuristic at the leaves, unless score() is overridden
+        score = self.evaluate if type(self).score is CustomPlayer.score else self.score
+        board = SearchBoard.from_state(state)
+
+        def min_value(alpha, beta, depth, ply, key):
             """Return the minimum value over all legal child nodes.
             """
-            if state.terminal_test():
-                return state.utility(self.player_id)
+            stats.nodes += 1
+            if not stats.nodes & 255 and self.search_expired():
+                raise SearchTimeout
+            if board.terminal_test():
+                return board.utility(self.player_id)
 
             if depth <= 0:
-                return self.score(state)
+                stats.leaves += 1
+                return score(board)
+
+            value, tt_move = tt.lookup(key, depth, alpha, beta)
+            if value is not None:
+                stats.tt_hits += 1
+                return value
+
+            if endgame and depth >= ENDGAME_MIN_DEPTH:
+                value = self.endgame_value(board)
+                if value is not None:
+                    tt.store(key, _SIZE, value, tt.EXACT, tt_move)
+                    return value
 
+            beta_orig = beta
             value = float("inf")
-            for action in state.actions():
-                value = min(value, max_value(state.result(action), alpha, beta, depth - 1))
-                # if value <= alpha:
-                #     return value
+            best_move = None
+            for index, action in enumerate(self.order_actions(board, ply, tt_move)):
+                child_key = zobrist_child_key(key, board, action)
+                board.make(action)
+                if pvs and best_move is not None and beta != float("inf"):
+                    child_value = max_value(beta - NULL_WINDOW, beta, depth - 1, ply + 1, child_key)
+                    if alpha < child_value < beta:
+                        child_value = max_value(alpha, beta, depth - 1, ply + 1, child_key)
+                else:
+                    child_value = max_value(alpha, beta, depth - 1, ply + 1, child_key)
+                board.unmake()
+                if best_move is None or child_value < value:
+                    value, best_move = child_value, action
+                if value <= alpha:
+                    self.record_cutoff(board, ply, depth, action)
+                    stats.add_cutoff(index)
+                    break
                 beta = min(beta, value)
+            if value <= alpha: bound = tt.UPPER
+            elif value >= beta_orig: bound = tt.LOWER
+            else: bound = tt.EXACT
+            tt.store(key, depth, value, bound, best_move)
             return value
 
-        def max_value(state, alpha, beta, depth):
+        def max_value(alpha, beta, depth, ply, key):
             """Return the maximum value over all legal child nodes.
             """
-            if state.terminal_test():
-                return state.utility(self.player_id)
+            stats.nodes += 1
+            if not stats.nodes & 255 and self.search_expired():
+                raise SearchTimeout
+            if board.terminal_test():
+                return board.utility(self.player_id)
 
             if depth <= 0:
-                return self.score(state)
+                stats.leaves += 1
+                return score(board)
+
+            value, tt_move = tt.lookup(key, depth, alpha, beta)
+            if value is not None:
+                stats.tt_hits += 1
+                return value
 
+            if endgame and depth >= ENDGAME_MIN_DEPTH:
+                value = self.endgame_value(board)
+                if value is not None:
+                    tt.store(key, _SIZE, value, tt.EXACT, tt_move)
+                    return value
+
+            alpha_orig = alpha
             value = float("-inf")
-            for action in state.actions():
-                value = max(value, min_value(state.result(action), alpha, beta, depth - 1))
-                # if value >= beta:
-                #     return value
+            best_move = None
+            for index, action in enumerate(self.order_actions(board, ply, tt_move)):
+                child_key = zobrist_child_key(key, board, action)
+                board.make(action)
+                if pvs and best_move is not None and alpha != float("-inf"):
+                    child_value = min_value(alpha, alpha + NULL_WINDOW, depth - 1, ply + 1, child_key)
+                    if alpha < child_value < beta:
+                        child_value = min_value(alpha, beta, depth - 1, ply + 1, child_key)
+                else:
+                    child_value = min_value(alpha, beta, depth - 1, ply + 1, child_key)
+                board.unmake()
+                if best_move is None or child_value > value:
+                    value, best_move = child_value, action
+                if value >= beta:
+                    self.record_cutoff(board, ply, depth, action)
+                    stats.add_cutoff(index)
+                    break
                 alpha = max(alpha, value)
+            if value >= beta: bound = tt.LOWER
+            elif value <= alpha_orig: bound = tt.UPPER
+            else: bound = tt.EXACT
+            tt.store(key, depth, value, bound, best_move)
             return value
 
-        alpha = float("-inf")
-        beta = float("inf")
+        key = zobrist_key(state)
+        _, tt_move = tt.lookup(key, depth, alpha, beta)
+        alpha_orig = alpha
         best_score = float("-inf")
         best_move = None
-        for action in state.actions():
-            value = min_value(state.result(action), alpha, beta, depth - 1)
-            alpha = max(alpha, value)
-            if float(value) >= best_score:
+        for action in self.order_actions(board, 0, tt_move):
+            child_key = zobrist_child_key(key, board, action)
+            board.make(action)
+            if pvs and best_move is not None and alpha != float("-inf"):
+                value = min_value(alpha, alpha + NULL_WINDOW, depth - 1, 1, child_key)
+                if alpha < value < beta:
+                    value = min_value(alpha, beta, depth - 1, 1, child_key)
+            else:
+                value = min_value(alpha, beta, depth - 1, 1, child_key)
+            board.unmake()
+            if best_move is None or value > best_score:
                 best_score = value
                 best_move = action
-        return best_move
+            if best_score >= beta:
+                break
+            alpha = max(alpha, best_score)
+        if best_score >= beta: bound = tt.LOWER
+        elif best_score <= alpha_orig: bound = tt.UPPER
+        else: bound = tt.EXACT
+        tt.store(key, depth, best_score, bound, best_move)
+        return best_score, best_move
+
+    def order_actions(self, state, ply, tt_move=None):
+        """Return the legal actions in state sorted for alpha-beta search
+
+        The best move stored in the transposition table comes first, then the
+        killer moves that caused cutoffs at the same ply, then the remaining
+        moves by history score and by the mobility of the mover at the target.
+        """
+        player_id = state.player()
+        loc = state.locs[player_id]
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        history = self.history[player_id]
+
+        def rank(action):
+            if action == tt_move: return (2, 0, 0)
+            target = action if loc is None else loc + action
+            return (int(action in killers), history[target], state.mobility_at(target))
+
+        return sorted(state.actions(), key=rank, reverse=True)
+
+    def record_cutoff(self, state, ply, depth, action):
+        """ Update the killer moves & history scores after action caused a cutoff """
+        while len(self.killers) <= ply: self.killers.append([])
+        killers = self.killers[ply]
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        loc = state.locs[state.player()]
+        target = action if loc is None else loc + action
+        self.history[state.player()][target] += depth * depth
 
     def score(self, state):
-        """Return the heuristic value of a game state
+        """Return the heuristic value of a game state (see HEURISTICS)
+        """
+        return self.evaluate(state)
+
+    def score_batch(self, words, ply_counts, locs):
+        """Return an array with the heuristic value of each state in a batch
+
+        This is the vectorized counterpart of score() for arrays built by
+        isolation.batch.pack_states(); it requires NumPy, and supports the
+        heuristics of the features in BATCH_FEATURES.
         """
-        own_loc = state.locs[self.player_id]
-        opp_loc = state.locs[1 - self.player_id]
-        own_lib = state.liberties(own_loc)
-        opp_lib = state.liberties(opp_loc)
-        own_moves = len(own_lib)
-        opp_moves = len(opp_lib)
-
-        # Define heuristics
-        # -----------------
-        # 1 = Standard (own_moves - opp_moves) strategy
-        # 2 = Offensive strategy
-        # 3 = Defensive strategy
-        # 4 = Dynamic offensive to defensive strategy
-        heuristic = 4
-
-        if heuristic == 1:
-            # This is the standard baseline heuristic, which is the difference
-            # between the number of moves available to the player and the number
-            # of moves available to the opponent
-            return own_moves - opp_moves
-
-        elif heuristic == 2:
-            # This offensive heuristic puts more weight on increasing its own
-            # liberties than on limiting the opponent's liberties
-            m = 0.25
-        elif heuristic == 3:
-            # This defensive heuristic puts more weight on limiting the
-            # opponent's liberties than on increasing its own liberties
-            m = 0.75
-        elif heuristic == 4:
-            # This dynamic heuristic gives a sense of time in the game by taking
-            # the ratio of the number of moves played to the total number of
-            # moves available on the board. This ratio is used to apply a smooth
-            # transition from an offensive to a defensive strategy throughout
-            # the game
-            m = state.ply_count / _SIZE
-        else:
-            raise ValueError("Invalid heuristic")
-
-        return m * own_moves - (1 - m) * opp_moves
+        import numpy as np
+        from isolation.batch import mobilities
+        moves = mobilities(words, locs)
+        center = np.array(_CENTER_DISTANCE + [0])[locs]  # 0 before a player is placed (loc -1)
+        player, opponent = self.player_id, 1 - self.player_id
+        features = {"own_moves": moves[:, player], "opp_moves": moves[:, opponent],
+                    "own_center": center[:, player], "opp_center": center[:, opponent]}
+        t = ply_counts / _SIZE
+        scores = np.zeros(len(ply_counts))
+        for feature, weight in self.weights.items():
+            if feature not in BATCH_FEATURES:
+                raise ValueError("The {} feature has no batch evaluator".format(feature))
+            w0, w1 = weight if isinstance(weight, tuple) else (weight, 0)
+            scores += (w0 + w1 * t) * features[feature]
+        return scores
 
     def minimax(self, state, depth):
 
@@ -179,8 +923,6 @@ class CustomPlayer(DataPlayer):
         return max(state.actions(), key=lambda x: min_value(state.result(x), depth - 1))
 
     def minimax_score(self, state):
-        own_loc = state.locs[self.player_id]
-        opp_loc = state.locs[1 - self.player_id]
-        own_liberties = state.liberties(own_loc)
-        opp_liberties = state.liberties(opp_loc)
-        return len(own_liberties) - len(opp_liberties)
+        own_moves, opp_moves = state.both_mobilities()
+        if self.player_id: own_moves, opp_moves = opp_moves, own_moves
+        return own_moves - opp_moves
@@ -2,66 +2,279 @@
 #                    YOU DO NOT NEED TO MODIFY THIS FILE                      #
 ###############################################################################
 import argparse
+import json
 import logging
 import math
 import os
 import random
 import textwrap
 
-from collections import namedtuple
-from multiprocessing.pool import ThreadPool as Pool
+from collections import defaultdict, deque, namedtuple
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Value
 
-from isolation import Isolation, Agent, play
-from sample_players import RandomPlayer, GreedyPlayer, MinimaxPlayer
-from my_custom_player import CustomPlayer
+from isolation import BUDGET_TIMEOUT, Isolation, Agent, SearchBudget, StatsSummary, play_record
+from isolation.record import GameArchive, Replay, append_game
+from sample_players import RandomPlayer, GreedyPlayer, MinimaxPlayer, MCTSPlayer
+from my_custom_player import HEURISTIC, HEURISTICS, CustomPlayer
 
 logger = logging.getLogger(__name__)
 
-NUM_PROCS = 1
+# use every core available to this process by default
+NUM_PROCS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
 NUM_ROUNDS = 5  # number times to replicate the match; increase for higher confidence estimate
 TIME_LIMIT = 150  # number of milliseconds before timeout
+RESULTS_LOG = "matches.jsonl"  # file name of the log with the record of every finished game
+SPRT_ALPHA = 0.05  # probability of accepting the stronger hypothesis (elo1) when elo0 holds
+SPRT_BETA = 0.05  # probability of accepting the weaker hypothesis (elo0) when elo1 holds
 
 TEST_AGENTS = {
     "RANDOM": Agent(RandomPlayer, "Random Agent"),
     "GREEDY": Agent(GreedyPlayer, "Greedy Agent"),
     "MINIMAX": Agent(MinimaxPlayer, "Minimax Agent"),
+    "MCTS": Agent(MCTSPlayer, "MCTS Agent"),
     "SELF": Agent(CustomPlayer, "Custom TestAgent")
 }
 
-Match = namedtuple("Match", "players initial_state time_limit match_id debug_flag")
+Match = namedtuple("Match", "players initial_state time_limit match_id debug_flag budget",
+                   defaults=(None,))
+Result = namedtuple("Result", "winner opening match_id")  # winner name & first two actions of a game
 
 
-def _run_matches(matches, name, num_processes=NUM_PROCS, debug=False):
+class MatchLog:
+    """ Append-only log of finished games, with one JSON object per line
+
+    Each line records the match id, the names of the players, the name of the
+    winner, the final Status, the initial state, the action history, the
+    time (in milliseconds) taken to choose each action and the search stats
+    reported for each action (see isolation.SearchStats). Every line is
+    flushed as soon as the game finishes, so an interrupted tournament can be
+    resumed from the log without replaying the finished games.
+
+    The search stats of every game in the log are aggregated by player name in
+    self.search_stats. If archive is given, the initial state & history of
+    every game are also appended to that file in the same order, as compact
+    game records (see isolation.record).
+    """
+    def __init__(self, filename, resume=False, archive=None):
+        self.finished = {}  # maps the match id of each game in the log to its Result
+        self.search_stats = defaultdict(StatsSummary)
+        line = "\n"
+        if resume and os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # the last line of an interrupted run may be incomplete
+                    self.finished[entry["match_id"]] = Result(
+                        entry["winner"], entry["history"][:2], entry["match_id"])
+                    self._count_stats(entry["players"], entry["initial_state"][1],
+                                      entry.get("search_stats", ()))
+        self._file = open(filename, "a" if resume else "w")
+        if not line.endswith("\n"):
+            self._file.write("\n")  # start a new line after an incomplete one
+        self._archive = None
+        if archive is not None:
+            self._archive = open(archive, "ab" if resume else "wb")
+            if resume:
+                # drop the last record of an interrupted run if it is incomplete
+                self._archive.truncate(GameArchive.load(archive).end)
+
+    def write(self, match, record):
+        """ Append the GameRecord of a finished match to the log """
+        initial_state = record.initial_state
+        players = [agent.name for agent in match.players]
+        self._count_stats(players, initial_state.ply_count, record.search_stats)
+        self._file.write(json.dumps({
+            "match_id": record.match_id,
+            "players": players,
+            "winner": record.winner.name,
+            "status": record.status.name,
+            "initial_state": [initial_state.board, initial_state.ply_count, initial_state.locs],
+            "history": [int(action) for action in record.history],
+            "move_times": [round(t, 1) for t in record.move_times],
+            "search_stats": record.search_stats,
+        }, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self._archive is not None:
+            append_game(self._archive, initial_state, record.history)
+            self._archive.flush()
+
+    def _count_stats(self, players, ply_count, search_stats):
+        """ Add the search stats of each move of a game to the summary of the
+        player who made the move """
+        for ply, stats in enumerate(search_stats, ply_count):
+            if stats is not None: self.search_stats[players[ply % 2]].add(stats)
+
+    def close(self):
+        self._file.close()
+        if self._archive is not None: self._archive.close()
+
+
+def _run_matches(matches, name, num_processes=NUM_PROCS, debug=False, log=None):
+    """ Play the matches and return a list with the Result of each game
+
+    Matches that are already recorded in the log are not played again; every
+    other game is appended to the log as soon as it finishes.
+    """
     results = []
-    pool = Pool(1) if debug else Pool(num_processes)
+    finished = log.finished if log is not None else {}
+    pending = [match for match in matches if match.match_id not in finished]
     print("Running {} games:".format(len(matches)))
-    for result in pool.imap_unordered(play, matches):
-        print("+" if result[0].name == name else '-', end="")
-        results.append(result)
+    if len(pending) < len(matches):
+        print("(skipping {} games found in the log)".format(len(matches) - len(pending)))
+    for match in matches:
+        if match.match_id in finished:
+            results.append(finished[match.match_id])
+            print("+" if finished[match.match_id].winner == name else '-', end="", flush=True)
+    pending_matches = {match.match_id: match for match in pending}
+    for record in _stream_matches(pending, num_processes, debug):
+        if log is not None:
+            log.write(pending_matches[record.match_id], record)
+        print("+" if record.winner.name == name else '-', end="", flush=True)
+        results.append(Result(record.winner.name, record.history[:2], record.match_id))
     print()
     return results
 
 
+def _stream_matches(matches, num_processes=NUM_PROCS, debug=False, replay=None, drain=None):
+    """ Play each match in its own worker process (or in the main process in
+    debug mode) and yield the GameRecord of each game in the order the games
+    finish.
+
+    Each worker plays one game at a time, so the agent search processes of a
+    game (see isolation.AgentWorker) never compete with another game for the
+    core of the worker. When there are enough cores, each worker is pinned to
+    a different core so that time limits are enforced under the same load in
+    every game.
+
+    Matches are drawn from the iterable only as workers become free. If
+    replay is given, it is called with the GameRecord of every finished game
+    and may return a follow-up Match (e.g., the fair replay of the game),
+    which is played before any new match.
+
+    If the caller stops early (closing the generator), the matches not
+    started are cancelled, but the games already running are played to the
+    end; if drain is given, it is called with the GameRecord of each of them
+    (e.g., to log them), otherwise they are discarded.
+    """
+    matches = iter(matches)
+    follow_ups = deque()
+
+    def next_match():
+        return follow_ups.popleft() if follow_ups else next(matches, None)
+
+    def finish(record):
+        follow_up = replay(record) if replay is not None else None
+        if follow_up is not None: follow_ups.append(follow_up)
+        return record
+
+    if debug:
+        match = next_match()
+        while match is not None:
+            yield finish(play_record(match))
+            match = next_match()
+        return
+    num_processes = max(1, num_processes)
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    initializer, initargs = None, ()
+    if len(cores) >= num_processes > 1:
+        initializer, initargs = _pin_worker, (Value('i', 0), cores)
+    executor = ProcessPoolExecutor(num_processes, initializer=initializer, initargs=initargs)
+    done, running = set(), set()
+    try:
+        while True:
+            while len(running) < num_processes:
+                match = next_match()
+                if match is None: break
+                running.add(executor.submit(play_record, match))
+            if not running: break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            while done:
+                yield finish(done.pop().result())
+    except GeneratorExit:
+        # the workers finish their current game before shutting down anyway
+        if drain is not None:
+            for future in done | wait(running).done:
+                if not future.cancelled() and future.exception() is None:
+                    drain(future.result())
+        raise
+    finally:
+        # don't start the remaining games if the caller stops early
+        executor.shutdown(cancel_futures=True)
+
+
+def _pin_worker(next_core, cores):
+    """ Pin a match worker process (and the agent processes it starts) to the
+    next unused core """
+    with next_core.get_lock():
+        core = cores[next_core.value % len(cores)]
+        next_core.value += 1
+    os.sched_setaffinity(0, {core})
+
+
 def make_fair_matches(matches, results):
     new_matches = []
     for _, game_history, match_id in results:
-        if len(game_history) < 2:
-            logger.warn(textwrap.dedent("""\
-                Unable to duplicate match {}
-                -- one of the players forfeit at the first move
-                """.format(match_id)))
-            continue
-        match = matches[match_id]
-        state = Isolation().result(game_history[0]).result(game_history[1])
-        fair_match = Match(players=match.players[::-1],
-                          initial_state=state,
-                          time_limit=match.time_limit,
-                          match_id=-match.match_id,
-                          debug_flag=match.debug_flag)
-        new_matches.append(fair_match)
+        fair_match = _fair_match(matches[match_id], game_history)
+        if fair_match is not None:
+            new_matches.append(fair_match)
     return new_matches
 
 
+def _fair_match(match, game_history):
+    """ Return the fair replay of a match given its action history (the
+    players switch sides and start from the opening moves of the match), or
+    None if one of the players forfeit before the opening was complete """
+    if len(game_history) < 2:
+        logger.warn(textwrap.dedent("""\
+            Unable to duplicate match {}
+            -- one of the players forfeit at the first move
+            """.format(match.match_id)))
+        return None
+    state = Replay(Isolation(), game_history[:2]).state(2)
+    return Match(players=match.players[::-1],
+                 initial_state=state,
+                 time_limit=match.time_limit,
+                 match_id=-match.match_id - 1,  # ids of fair matches are < 0
+                 debug_flag=match.debug_flag,
+                 budget=match.budget)
+
+
+def _make_matches(custom_agent, test_agent, cli_args):
+    """ Yield the two matches of each round, so that each agent plays as the
+    first player in one of them """
+    for match_id in range(cli_args.rounds):
+        state = Isolation()
+        yield Match(
+            players=(test_agent, custom_agent),
+            initial_state=state,
+            time_limit=cli_args.time_limit,
+            match_id=2 * match_id,
+            debug_flag=cli_args.debug,
+            budget=_match_budget(cli_args, 2 * match_id))
+        yield Match(
+            players=(custom_agent, test_agent),
+            initial_state=state,
+            time_limit=cli_args.time_limit,
+            match_id=2 * match_id + 1,
+            debug_flag=cli_args.debug,
+            budget=_match_budget(cli_args, 2 * match_id + 1))
+
+
+def _match_budget(cli_args, match_id):
+    """ Return the SearchBudget of a match (None unless a node or depth budget,
+    or a seed, is set on the command line); each match draws different random
+    numbers from the seed """
+    nodes, depth, seed = cli_args.nodes, cli_args.depth, cli_args.seed
+    if nodes is None and depth is None and seed is None:
+        return None
+    return SearchBudget(nodes, depth, None if seed is None else "{}:{}".format(seed, match_id),
+                        cli_args.budget_timeout)
+
+
 def play_matches(custom_agent, test_agent, cli_args):
     """ Play a specified number of rounds between two agents. Each round
     consists of two games, and each player plays as first player in one
@@ -74,44 +287,188 @@ def play_matches(custom_agent, test_agent, cli_args):
     player a victory. Playing "fair" matches this way will balance out the
     advantage of picking perfect openings (the player would win the first
     time, and then lose when their opponent uses that move against them).
+
+    Return the number of wins of the custom agent, the number of games, and
+    the search stats of each agent aggregated over all games in the log.
     """
-    matches = []
-    for match_id in range(cli_args.rounds):
-        state = Isolation()
-        matches.append(Match(
-            players=(test_agent, custom_agent),
-            initial_state=state,
-            time_limit=cli_args.time_limit,
-            match_id=2 * match_id,
-            debug_flag=cli_args.debug))
-        matches.append(Match(
-            players=(custom_agent, test_agent),
-            initial_state=state,
-            time_limit=cli_args.time_limit,
-            match_id=2 * match_id + 1,
-            debug_flag=cli_args.debug))
+    matches = list(_make_matches(custom_agent, test_agent, cli_args))
 
     # Run all matches -- must be done before fair matches in order to populate
     # the first move from each player; these moves are reused in the fair matches
-    results = _run_matches(matches, custom_agent.name, cli_args.processes)
+    log = MatchLog(cli_args.log, cli_args.resume, cli_args.archive)
+    try:
+        results = _run_matches(matches, custom_agent.name, cli_args.processes, cli_args.debug, log)
+
+        if cli_args.fair_matches:
+            _matches = make_fair_matches(matches, results)
+            results.extend(_run_matches(
+                _matches, custom_agent.name, cli_args.processes, cli_args.debug, log))
+    finally:
+        log.close()
+
+    wins = sum(int(r.winner == custom_agent.name) for r in results)
+    return wins, len(matches) * (1 + int(cli_args.fair_matches)), log.search_stats
+
+
+class SPRT:
+    """ Generalized sequential probability ratio test of the Elo difference
+    between two agents, measured on pairs of fair matches
+
+    The two games of a pair (a game and its fair replay) share an opening, so
+    their results are correlated; the test counts the score of each pair (0,
+    0.5, ..., 2 points for the custom agent) in a pentanomial distribution and
+    uses the normal approximation of the log-likelihood ratio between the
+    hypotheses that the custom agent is elo0 or elo1 Elo points stronger:
+
+        LLR = N * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+    where s0 & s1 are the expected pair scores (in [0, 1]) under each
+    hypothesis, and mean & variance are the mean and variance of the observed
+    pair scores over N pairs. A prior of one pair of each outcome (lost both,
+    split, won both) keeps the variance positive while there are only a few
+    pairs. The test accepts elo1 when the LLR rises above log((1-beta)/alpha),
+    and accepts elo0 when it falls below log(beta/(1-alpha)).
+    """
+    def __init__(self, elo0, elo1, alpha=SPRT_ALPHA, beta=SPRT_BETA):
+        self.elo0, self.elo1 = elo0, elo1
+        self.score0, self.score1 = _expected_score(elo0), _expected_score(elo1)
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+        self.pairs = [0] * 5  # number of pairs scoring 0, 0.5, 1, 1.5 & 2 points
+
+    def add_pair(self, points):
+        """ Count a pair of games where the custom agent scored points (0-2) """
+        self.pairs[round(2 * points)] += 1
 
-    if cli_args.fair_matches:
-        _matches = make_fair_matches(matches, results)
-        results.extend(_run_matches(_matches, custom_agent.name, cli_args.processes))
+    def llr(self):
+        """ Return the log-likelihood ratio of elo1 over elo0 """
+        counts = [n + prior for n, prior in zip(self.pairs, (1, 0, 1, 0, 1))]
+        total = sum(counts)
+        mean = sum(n * i / 4 for i, n in enumerate(counts)) / total
+        variance = sum(n * (i / 4 - mean) ** 2 for i, n in enumerate(counts)) / total
+        num_pairs = sum(self.pairs)
+        return (num_pairs * (self.score1 - self.score0) * (2 * mean - self.score0 - self.score1)
+                / (2 * variance))
 
-    wins = sum(int(r[0].name == custom_agent.name) for r in results)
-    return wins, len(matches) * (1 + int(cli_args.fair_matches))
+    def decision(self):
+        """ Return elo1 or elo0 if the test accepted that hypothesis, or None """
+        llr = self.llr()
+        if llr >= self.upper_bound: return self.elo1
+        if llr <= self.lower_bound: return self.elo0
+        return None
+
+    def elo(self):
+        """ Return the Elo difference estimated from the pair scores """
+        num_pairs = sum(self.pairs)
+        if not num_pairs: return 0.
+        mean = sum(n * i / 4 for i, n in enumerate(self.pairs)) / num_pairs
+        if mean in (0, 1): return math.copysign(float("inf"), mean - 0.5)
+        return -400 * math.log10(1 / mean - 1)
+
+
+def _expected_score(elo):
+    """ Return the expected score of a player elo points stronger than its opponent """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def play_sprt(custom_agent, test_agent, cli_args):
+    """ Play pairs of fair matches between two agents until the SPRT accepts
+    one of its hypotheses, or until all rounds have been played, and return
+    the SPRT along with the number of wins & games of the custom agent and
+    the search stats of each agent aggregated over all games in the log.
+
+    Each game is replayed as a fair match as soon as it finishes, so pairs are
+    completed (and the test is updated) while the tournament runs. Games found
+    in the log are counted without being played again when resuming. The games
+    still running when the test reaches its decision are logged but not
+    counted, so a resumed run counts them instead of playing them again.
+    """
+    elo0, elo1 = cli_args.sprt
+    sprt = SPRT(elo0, elo1, cli_args.alpha, cli_args.beta)
+    log = MatchLog(cli_args.log, cli_args.resume, cli_args.archive)
+    originals = {}  # matches waiting for their fair replay to finish
+    points = {}  # points scored by the custom agent in each of those matches
+    totals = [0, 0]  # wins & games of the custom agent
+
+    def count_game(result, match):
+        """ Count a finished game, and return its fair replay if it is an
+        original match that can be replayed """
+        score = int(result.winner == custom_agent.name)
+        totals[0] += score
+        totals[1] += 1
+        if result.match_id < 0:
+            sprt.add_pair(score + points.pop(-result.match_id - 1))
+            return None
+        fair_match = _fair_match(match, result.opening)
+        if fair_match is not None:
+            originals[fair_match.match_id] = fair_match
+            points[match.match_id] = score
+        return fair_match
+
+    def new_matches():
+        """ Yield the original matches not found in the log, and the fair
+        replays of the original matches found in the log """
+        for match in _make_matches(custom_agent, test_agent, cli_args):
+            if sprt.decision() is not None: return
+            if match.match_id not in log.finished:
+                originals[match.match_id] = match
+                yield match
+                continue
+            fair_match = count_game(log.finished[match.match_id], match)
+            if fair_match is None: continue
+            if fair_match.match_id in log.finished:
+                count_game(log.finished[fair_match.match_id], fair_match)
+            else:
+                yield fair_match
+
+    def replay(record):
+        match = originals.pop(record.match_id)
+        log.write(match, record)
+        return count_game(Result(record.winner.name, record.history[:2], record.match_id), match)
+
+    print("Running SPRT (elo0 = {}, elo1 = {}, alpha = {}, beta = {}):".format(
+        elo0, elo1, cli_args.alpha, cli_args.beta))
+    try:
+        stream = _stream_matches(new_matches(), cli_args.processes, cli_args.debug, replay,
+                                 drain=lambda record: log.write(originals.pop(record.match_id), record))
+        for record in stream:
+            print("+" if record.winner.name == custom_agent.name else '-', end="", flush=True)
+            if sprt.decision() is not None:
+                stream.close()  # cancel the games that have not started & log the others
+                break
+    finally:
+        log.close()
+    print()
+    return sprt, totals[0], totals[1], log.search_stats
 
 
 def main(args):
     test_agent = TEST_AGENTS[args.opponent.upper()]
     custom_agent = Agent(CustomPlayer, "Custom Agent")
-    wins, num_games = play_matches(custom_agent, test_agent, args)
+    if args.helpers or args.heuristic != HEURISTIC:
+        custom_agent = Agent(partial(CustomPlayer, helpers=args.helpers, heuristic=args.heuristic),
+                             custom_agent.name)
+    if args.sprt:
+        sprt, wins, num_games, search_stats = play_sprt(custom_agent, test_agent, args)
+        decision = sprt.decision()
+        if decision is None:
+            summary = "SPRT was inconclusive after {} rounds".format(args.rounds)
+        else:
+            summary = "SPRT accepted elo{} = {}".format(int(decision == sprt.elo1), decision)
+        summary += " ({} pairs, LLR {:.2f} in [{:.2f}, {:.2f}], estimated Elo difference {:+.1f})".format(
+            sum(sprt.pairs), sprt.llr(), sprt.lower_bound, sprt.upper_bound, sprt.elo())
+        logger.info(summary)
+        print(summary)
+    else:
+        wins, num_games, search_stats = play_matches(custom_agent, test_agent, args)
 
     logger.info("Your agent won {:.1f}% of matches against {}".format(
        100. * wins / num_games, test_agent.name))
     print("Your agent won {:.1f}% of matches against {}".format(
        100. * wins / num_games, test_agent.name))
+    for name, summary in sorted(search_stats.items()):
+        logger.info("{} search: {}".format(name, summary))
+        print("{} search: {}".format(name, summary))
     print()
 
 
@@ -129,7 +486,27 @@ if __name__ == "__main__":
 
             - Run 100 rounds (100 rounds = 200 games) against the minimax agent with 1 process:
 
-                $python run_match.py -r 100
+                $python run_match.py -r 100 -p 1
+
+            - Run 20 reproducible games against the greedy agent, where each move of your
+              agent searches 20000 nodes instead of being cut off by the time limit:
+
+                $python run_match.py -r 10 -o GREEDY --nodes 20000 --seed 1
+
+            - Analyze 2 games against the minimax agent one at a time, where each move of your
+              agent is searched by 3 helper processes in parallel with the main search:
+
+                $python run_match.py -r 1 -p 1 --helpers 3 -t 1000
+
+            - Compare another heuristic of your agent against the greedy agent:
+
+                $python run_match.py -f -r 20 -o GREEDY --heuristic lookahead
+
+            - Play pairs of fair matches against the minimax agent (up to 1000 rounds) until
+              a sequential probability ratio test decides whether your agent is at least 20
+              Elo points stronger (or no stronger at all):
+
+                $python run_match.py --sprt 0 20 -r 1000
         """)
     )
     parser.add_argument(
@@ -170,26 +547,113 @@ if __name__ == "__main__":
     parser.add_argument(
         '-p', '--processes', type=int, default=NUM_PROCS,
         help="""\
-            Set the number of parallel processes to use for running matches.  WARNING: 
-            Windows users may see inconsistent performance using >1 thread.  Check the 
-            log file for time out errors and increase the time limit (add 50-100ms) if 
-            your agent performs poorly.
+            Set the number of parallel processes to use for running matches (defaults to
+            the number of available cores).  Each process plays one game at a time, and
+            is pinned to its own core when there are enough cores.  Check the log file for
+            time out errors and increase the time limit (add 50-100ms) if your agent
+            performs poorly.
         """
     )
     parser.add_argument(
         '-t', '--time_limit', type=int, default=TIME_LIMIT,
         help="Set the maximum allowed time (in milliseconds) for each call to agent.get_action()."
     )
+    parser.add_argument(
+        '--nodes', type=int,
+        help="""\
+            Limit the search of each move to this many nodes instead of cutting it off at the
+            time limit, so that the games do not depend on the speed or the load of the machine
+            (agents that do not read queue.budget, like the sample players, are unaffected).
+        """
+    )
+    parser.add_argument(
+        '--depth', type=int,
+        help="Limit the search of each move to this depth instead of cutting it off at the time limit."
+    )
+    parser.add_argument(
+        '--budget_timeout', type=float,
+        help="""\
+            Stop the search of a move under a --nodes or --depth budget after this many seconds
+            (default: {}), so agents that ignore the budget cannot hang the tournament.
+        """.format(BUDGET_TIMEOUT)
+    )
+    parser.add_argument(
+        '--seed', type=int,
+        help="Seed the random choices of the agents (e.g., the opening moves) to replay the same games."
+    )
+    parser.add_argument(
+        '--helpers', type=int, default=0,
+        help="""\
+            Search each move of your agent with this many helper processes in parallel with
+            the main search, sharing its transposition table (useful with -p 1 to search deeper
+            when playing one game at a time; ignored under a --nodes or --depth budget).
+        """
+    )
+    parser.add_argument(
+        '--heuristic', type=str, default=HEURISTIC, choices=sorted(HEURISTICS),
+        help="Set the heuristic of your agent (see HEURISTICS in my_custom_player.py)."
+    )
+    parser.add_argument(
+        '-l', '--log', type=str, default=RESULTS_LOG,
+        help="""\
+            Set the file name of the results log. The record of every game (players, winner,
+            status, move history & move times) is appended to the log as one JSON object
+            per line as soon as the game finishes.
+        """
+    )
+    parser.add_argument(
+        '--archive', type=str,
+        help="""\
+            Also append the initial state & moves of every game to this file as compact game
+            records (one byte per move, in the order of the results log), which can be read
+            back in bulk with isolation.record.GameArchive.
+        """
+    )
+    parser.add_argument(
+        '--sprt', type=float, nargs=2, metavar=("ELO0", "ELO1"),
+        help="""\
+            Run a sequential probability ratio test instead of a fixed number of rounds: play
+            pairs of fair matches until the test accepts that your agent is ELO0 or ELO1 Elo
+            points stronger than the opponent (e.g., --sprt 0 20), or until all the rounds
+            set by --rounds have been played.
+        """
+    )
+    parser.add_argument(
+        '--alpha', type=float, default=SPRT_ALPHA,
+        help="Set the probability that the SPRT accepts ELO1 when ELO0 is true."
+    )
+    parser.add_argument(
+        '--beta', type=float, default=SPRT_BETA,
+        help="Set the probability that the SPRT accepts ELO0 when ELO1 is true."
+    )
+    parser.add_argument(
+        '--resume', action="store_true",
+        help="""\
+            Resume an interrupted tournament: games already recorded in the results log are
+            not played again (run with the same options as the interrupted tournament).
+        """
+    )
     args = parser.parse_args()
 
-    logging.basicConfig(filename="matches.log", filemode="w", level=logging.DEBUG)
+    logging.basicConfig(filename="matches.log", filemode="a" if args.resume else "w",
+                        level=logging.DEBUG)
     logging.info(
         "Search Configuration:\n" +
         "Opponent: {}\n".format(args.opponent) +
         "Rounds: {}\n".format(args.rounds) +
         "Fair Matches: {}\n".format(args.fair_matches) +
         "Time Limit: {}\n".format(args.time_limit) +
+        "Nodes: {}\n".format(args.nodes) +
+        "Depth: {}\n".format(args.depth) +
+        "Seed: {}\n".format(args.seed) +
+        "Budget Timeout: {}\n".format(args.budget_timeout) +
         "Processes: {}\n".format(args.processes) +
+        "Helpers: {}\n".format(args.helpers) +
+        "Heuristic: {}\n".format(args.heuristic) +
+        "Results Log: {}\n".format(args.log) +
+        "Archive: {}\n".format(args.archive) +
+        "Resume: {}\n".format(args.resume) +
+        "SPRT: {}\n".format(args.sprt) +
         "Debug Mode: {}".format(args.debug)
     )
 
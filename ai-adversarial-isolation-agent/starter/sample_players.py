@@ -2,8 +2,17 @@
 #     YOU CAN MODIFY THIS FILE, BUT CHANGES WILL NOT APPLY DURING GRADING     #
 ###############################################################################
 import logging
+import os
 import pickle
 import random
+import time
+
+from array import array
+from math import log, sqrt
+
+from isolation import SearchStats
+from isolation.book import load_book
+from isolation.isolation import _MOVES, _NEIGHBORS, _SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +33,38 @@ class BasePlayer:
         raise NotImplementedError
 
 
+BOOK_FILE = "data.book"  # memory-mapped opening book (see isolation.book), preferred to DATA_FILE
+DATA_FILE = "data.pickle"
+
+_DATA = {}  # data loaded by this process, by file name
+
+
+def load_data():
+    """ Return the data of DataPlayer agents: the OpeningBook in BOOK_FILE if
+    it exists, or else the object pickled in DATA_FILE (None if neither can be
+    loaded)
+
+    The data is loaded once per process on first use and shared by every
+    agent instance, so it must be treated as read-only.
+    """
+    filename = os.path.abspath(BOOK_FILE if os.path.exists(BOOK_FILE) else DATA_FILE)
+    if filename not in _DATA:
+        try:
+            if filename.endswith(".book"):
+                _DATA[filename] = load_book(filename)
+            else:
+                with open(filename, "rb") as f:
+                    _DATA[filename] = pickle.load(f)
+        except (IOError, TypeError, ValueError) as e:
+            logger.info(str(e))
+            _DATA[filename] = None
+    return _DATA[filename]
+
+
 class DataPlayer(BasePlayer):
     def __init__(self, player_id):
         super().__init__(player_id)
-        try:
-            with open("data.pickle", "rb") as f:
-                self.data = pickle.load(f)
-        except (IOError, TypeError) as e:
-            logger.info(str(e))
-            self.data = None
+        self.data = load_data()
 
 
 class RandomPlayer(BasePlayer):
@@ -53,9 +85,7 @@ class GreedyPlayer(BasePlayer):
     equivalent to a minimax search agent with a search depth of one.
     """
     def score(self, state):
-        own_loc = state.locs[self.player_id]
-        own_liberties = state.liberties(own_loc)
-        return len(own_liberties)
+        return state.mobility(self.player_id)
 
     def get_action(self, state):
         """Select the move from the available legal moves with the highest
@@ -128,8 +158,233 @@ class MinimaxPlayer(BasePlayer):
         return max(state.actions(), key=lambda x: min_value(state.result(x), depth - 1))
 
     def score(self, state):
-        own_loc = state.locs[self.player_id]
-        opp_loc = state.locs[1 - self.player_id]
-        own_liberties = state.liberties(own_loc)
-        opp_liberties = state.liberties(opp_loc)
-        return len(own_liberties) - len(opp_liberties)
+        own_moves, opp_moves = state.both_mobilities()
+        if self.player_id: own_moves, opp_moves = opp_moves, own_moves
+        return own_moves - opp_moves
+
+
+UCT_EXPLORATION = 1.0  # exploration constant of the UCT selection rule
+MCTS_MAX_NODES = 2**18  # the tree stops growing (but playouts go on) at this many nodes
+MCTS_CHECK_INTERVAL = 128  # number of playouts between checks of the clock & the best move
+MCTS_TIME_MARGIN = 0.005  # seconds reserved to publish the final move & tree
+MCTS_PLAYOUTS_PER_PLY = 1000  # playouts per ply of a depth budget (see SearchBudget)
+MCTS_DEFAULT_PLAYOUTS = 10000  # playouts of a move without a time limit, a node budget or a depth budget
+
+# _ROLLOUT_MOVES[loc] is a (neighbors, targets) pair: a bitboard of the cells a
+# knight at loc reaches on an empty board, and a dict that maps each subset of
+# those cells (i.e., `board & neighbors`) to the tuple of open target cells
+_ROLLOUT_MOVES = [(_NEIGHBORS[loc], {mask: targets for mask, (_, targets) in _MOVES[loc].items()})
+                  for loc in range(_SIZE)]
+
+
+class MCTSTree:
+    """ Monte Carlo search tree stored in flat arrays indexed by node id
+
+    Node 0 is the root, whose state is given by the board, ply_count & locs
+    attributes. The children of an expanded node are stored contiguously from
+    id first[node] to first[node] + count[node] - 1 (first[node] is -1 until
+    the node is expanded); action[node] is the action that leads to the node
+    from its parent, visits[node] is the number of playouts through the node,
+    and wins[node] is the number of those playouts won by the player who made
+    action[node].
+
+    stats holds the SearchStats of the last search: the number of playouts
+    (nodes), the deepest node reached (depth), and the search time.
+    """
+    def __init__(self, state):
+        self.board, self.ply_count, self.locs = state.board, state.ply_count, state.locs
+        self.first = array('l', [-1])
+        self.count = array('B', [0])
+        self.action = array('b', [0])
+        self.visits = array('l', [0])
+        self.wins = array('l', [0])
+        self.stats = SearchStats()
+
+    def __len__(self):
+        return len(self.visits)
+
+    def expand(self, node, actions):
+        """ Append a child of node for each of the actions """
+        num_children = len(actions)
+        self.first[node] = len(self.visits)
+        self.count[node] = num_children
+        self.first.extend([-1] * num_children)
+        self.count.extend(bytes(num_children))
+        self.action.extend(actions)
+        self.visits.extend([0] * num_children)
+        self.wins.extend([0] * num_children)
+
+    def children(self, node):
+        """ Return the range of the ids of the children of node """
+        first = self.first[node]
+        return range(first, first + self.count[node]) if first >= 0 else range(0)
+
+    def best_action(self):
+        """ Return the action of the most visited child of the root (None if
+        the root has not been expanded or has no children) """
+        children = self.children(0)
+        if not children: return None
+        return self.action[max(children, key=self.visits.__getitem__)]
+
+    def subtree(self, node, state):
+        """ Return a new tree holding a copy of the subtree rooted at node,
+        whose root is the given state """
+        tree = MCTSTree(state)
+        tree.visits[0], tree.wins[0] = self.visits[node], self.wins[node]
+        pending = [(node, 0)]
+        for old, new in pending:
+            first, num_children = self.first[old], self.count[old]
+            if first < 0: continue
+            start = len(tree)
+            tree.first[new], tree.count[new] = start, num_children
+            tree.first.extend([-1] * num_children)
+            tree.count.extend(bytes(num_children))
+            tree.action.extend(self.action[first:first + num_children])
+            tree.visits.extend(self.visits[first:first + num_children])
+            tree.wins.extend(self.wins[first:first + num_children])
+            pending.extend((first + i, start + i) for i in range(num_children))
+        return tree
+
+    def find(self, state):
+        """ Return the id of the grandchild of the root with the given state
+        (i.e., the state after one move of each player), or None """
+        if state.ply_count != self.ply_count + 2: return None
+        player_id = self.ply_count % 2
+        for child in self.children(0):
+            own_loc = self.locs[player_id] + self.action[child]
+            if own_loc != state.locs[player_id]: continue
+            for grandchild in self.children(child):
+                opp_loc = self.locs[1 - player_id] + self.action[grandchild]
+                if opp_loc == state.locs[1 - player_id]:
+                    return grandchild
+        return None
+
+
+def _rollout(board, own_loc, opp_loc, rand):
+    """ Play random moves from the position with the given open cells until a
+    player is stuck, and return 1 if the player to move (at own_loc) wins or
+    0 if the opponent wins """
+    table = _ROLLOUT_MOVES
+    own, opp = table[own_loc], table[opp_loc]
+    turn = 0
+    while True:
+        neighbors, targets = own
+        targets = targets[board & neighbors]
+        if not targets: return turn
+        target = targets[int(rand() * len(targets))]
+        board ^= 1 << target
+        own, opp = opp, table[target]
+        turn ^= 1
+
+
+class MCTSPlayer(BasePlayer):
+    """ Agent using Monte Carlo tree search with the UCT selection rule
+
+    Each playout selects a path down the tree by UCT, adds the children of
+    the leaf at the end of the path to the tree, and finishes the game with
+    random moves. The tree (see MCTSTree) is carried to the next move in
+    self.context, and the subtree of the new state is searched further. The
+    most visited move is put in the queue every time it changes, and once
+    more with the final tree when the time runs out (or when the playout
+    limit, or the node budget of the queue, is reached). A depth budget of
+    the queue allows MCTS_PLAYOUTS_PER_PLY playouts per ply, and a move
+    without any limit plays MCTS_DEFAULT_PLAYOUTS playouts.
+    """
+    def __init__(self, player_id, exploration=UCT_EXPLORATION, playout_limit=None):
+        super().__init__(player_id)
+        self.exploration = exploration
+        self.playout_limit = playout_limit
+
+    def get_action(self, state):
+        """ Choose an action available in the current state
+
+        See RandomPlayer and GreedyPlayer for examples.
+        """
+        if state.ply_count < 2:
+            self.queue.put(random.choice(state.actions()))
+            return
+        tree = self.context if isinstance(self.context, MCTSTree) else None
+        node = tree.find(state) if tree is not None else None
+        self.context = tree.subtree(node, state) if node is not None else MCTSTree(state)
+        time_left = getattr(self.queue, "time_left", lambda: None)()
+        deadline = float("inf") if time_left is None else time.perf_counter() + time_left - MCTS_TIME_MARGIN
+        budget = getattr(self.queue, "budget", None)
+        limits = [self.playout_limit, budget and budget.nodes,
+                  budget and budget.depth and budget.depth * MCTS_PLAYOUTS_PER_PLY]
+        limit = min((n for n in limits if n), default=float("inf"))
+        if limit == float("inf") and deadline == float("inf"):
+            limit = MCTS_DEFAULT_PLAYOUTS  # never search without an end
+        self.search(self.context, deadline, limit)
+
+    def search(self, tree, deadline=float("inf"), limit=float("inf")):
+        """ Run playouts from the root of the tree until the deadline or until
+        limit playouts have been played, and put the best move in the queue """
+        start_time = time.perf_counter()
+        stats = tree.stats = SearchStats()
+        first, count, action, visits, wins = tree.first, tree.count, tree.action, tree.visits, tree.wins
+        root_player = tree.ply_count % 2
+        exploration = self.exploration ** 2
+        rand = random.random
+        moves, neighbors = _MOVES, _NEIGHBORS
+        if first[0] < 0:
+            loc = tree.locs[root_player]
+            tree.expand(0, moves[loc][tree.board & neighbors[loc]][0])
+        if not count[0]:
+            return  # the game is over
+        last_action = tree.best_action()
+        self.queue.put(last_action)
+        playouts = 0
+        while playouts < limit:
+            board, locs, player, node = tree.board, list(tree.locs), root_player, 0
+            path = [0]
+            # selection: follow the UCT rule down to a leaf of the tree
+            while True:
+                child = first[node]
+                if child < 0 or not count[node]: break
+                scale = exploration * log(visits[node] or 1)
+                best_value = -1.
+                for c in range(child, child + count[node]):
+                    n = visits[c]
+                    if not n:
+                        child = c
+                        break
+                    value = wins[c] / n + sqrt(scale / n)
+                    if value > best_value: best_value, child = value, c
+                target = locs[player] + action[child]
+                board ^= 1 << target
+                locs[player] = target
+                player ^= 1
+                node = child
+                path.append(node)
+            # expansion: add the children of a leaf visited before, and play
+            # the first playout from one of them
+            if first[node] < 0 and visits[node] and len(visits) < MCTS_MAX_NODES:
+                loc = locs[player]
+                tree.expand(node, moves[loc][board & neighbors[loc]][0])
+                if count[node]:
+                    node = first[node] + int(rand() * count[node])
+                    target = locs[player] + action[node]
+                    board ^= 1 << target
+                    locs[player] = target
+                    player ^= 1
+                    path.append(node)
+            # simulation & backpropagation
+            winner = player if _rollout(board, locs[player], locs[1 - player], rand) else 1 - player
+            mover = 1 - root_player  # the player who made the action of the root (none)
+            for node in path:
+                visits[node] += 1
+                if mover == winner: wins[node] += 1
+                mover ^= 1
+            stats.depth = max(stats.depth, len(path) - 1)
+            playouts += 1
+            if not playouts % MCTS_CHECK_INTERVAL:
+                if time.perf_counter() > deadline: break
+                best_action = tree.best_action()
+                if best_action != last_action:
+                    stats.nodes = playouts
+                    self.queue.put(best_action)
+                    last_action = best_action
+        stats.nodes = playouts
+        stats.iteration_times.append(1000 * (time.perf_counter() - start_time))
+        self.queue.put(tree.best_action())
+
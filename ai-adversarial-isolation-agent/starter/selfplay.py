@@ -0,0 +1,331 @@
+import argparse
+import logging
+import math
+import os
+import random
+import textwrap
+
+from array import array
+from functools import partial
+from multiprocessing import Pool
+
+from isolation import Isolation
+from isolation.isolation import _SIZE
+from isolation.record import Replay, append_game, decode_game, encode_game
+from my_custom_player import BATCH_FEATURES, HEURISTIC, HEURISTICS, CustomPlayer
+
+logger = logging.getLogger(__name__)
+
+NUM_GAMES = 1000  # number of self-play games generated by default
+SEARCH_DEPTH = 2  # depth of the search used to choose each self-play move
+RANDOM_PLIES = 4  # number of random moves at the start of every game
+EXPLORATION = 0.1  # probability of a random move after the opening
+NUM_PROCS = os.cpu_count()
+DATASET = "selfplay"  # directory of the dataset
+CHUNK_ROWS = 1 << 20  # number of positions scored at once by the fitter
+NEWTON_ITERATIONS = 20  # maximum number of Newton steps of a fit
+
+# Columns of a dataset: one file per column in the dataset directory, with the
+# array typecode & the number of values per position. The board of a position
+# is stored as the two 64-bit words of isolation.batch.pack_boards(), and the
+# result is the id of the player who won the game of the position.
+COLUMNS = {
+    "words": ("Q", 2),
+    "locs": ("b", 2),
+    "ply": ("B", 1),
+    "result": ("B", 1),
+}
+_WORD_MASK = (1 << 64) - 1
+
+
+def play_game(index, seed=0, depth=SEARCH_DEPTH, random_plies=RANDOM_PLIES, exploration=EXPLORATION):
+    """ Play one self-play game of CustomPlayer & return its (record, winner)
+
+    The first random_plies moves are random, and every later move is random
+    with probability exploration (otherwise the move chosen by a search to
+    the given depth), so that the games cover many different positions. The
+    random choices of a game only depend on the seed & the index of the game.
+    The game is returned as a compact record (see isolation.record), which is
+    much cheaper to send between processes than the states of the game.
+    """
+    rng = random.Random("{}:{}".format(seed, index))
+    players = [CustomPlayer(0), CustomPlayer(1)]
+    state, history = Isolation(), []
+    while not state.terminal_test():
+        if state.ply_count < random_plies or rng.random() < exploration:
+            action = rng.choice(state.actions())
+        else:
+            action = players[state.player()].search(state, depth)[1]
+        history.append(action)
+        state = state.result(action)
+    winner = 0 if state.utility(0) > 0 else 1
+    return encode_game(Isolation(), history), winner
+
+
+def game_positions(initial_state, history, winner):
+    """ Yield the positions of a game that a heuristic can be asked to score:
+    the non-terminal states after both players are placed, and the winner """
+    replay = Replay(initial_state, history)
+    for ply in range(initial_state.ply_count, initial_state.ply_count + len(history)):
+        state = replay.state(ply)
+        if None not in state.locs:
+            yield state, winner
+
+
+class DatasetWriter:
+    """Append positions to the column files of a dataset directory
+
+    Positions are buffered in arrays and appended to every column file at
+    once by flush(). Opening an existing dataset appends to it, after
+    dropping the rows that an interrupted run wrote to some columns only.
+    """
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        rows = dataset_rows(directory)
+        self.columns = {}
+        self.files = {}
+        for name, (typecode, width) in COLUMNS.items():
+            self.columns[name] = array(typecode)
+            self.files[name] = open(os.path.join(directory, name), "ab")
+            self.files[name].truncate(rows * width * self.columns[name].itemsize)
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, state, winner):
+        """ Add the position of a state from a game won by player winner """
+        self.columns["words"].extend((state.board & _WORD_MASK, state.board >> 64))
+        self.columns["locs"].extend(state.locs)
+        self.columns["ply"].append(state.ply_count)
+        self.columns["result"].append(winner)
+        self.rows += 1
+
+    def flush(self):
+        for name, column in self.columns.items():
+            column.tofile(self.files[name])
+            self.files[name].flush()
+            del column[:]
+
+    def close(self):
+        self.flush()
+        for f in self.files.values(): f.close()
+
+
+def dataset_rows(directory):
+    """ Return the number of positions stored in every column of a dataset """
+    rows = []
+    for name, (typecode, width) in COLUMNS.items():
+        filename = os.path.join(directory, name)
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        rows.append(size // (width * array(typecode).itemsize))
+    return min(rows)
+
+
+def generate(num_games=NUM_GAMES, directory=DATASET, num_processes=NUM_PROCS, seed=0,
+             depth=SEARCH_DEPTH, archive=None):
+    """ Play num_games self-play games on num_processes processes & append
+    their positions to the dataset in directory, as the games finish; the
+    games are also appended to the archive file if it is given. Return the
+    number of positions added.
+    """
+    play = partial(play_game, seed=seed, depth=depth)
+    archive_file = open(archive, "ab") if archive is not None else None
+    with DatasetWriter(directory) as writer, Pool(num_processes) as pool:
+        start = writer.rows
+        try:
+            for count, (record, winner) in enumerate(pool.imap_unordered(play, range(num_games), 16), 1):
+                initial_state, history = decode_game(record)
+                for state, result in game_positions(initial_state, history, winner):
+                    writer.add(state, result)
+                if archive_file is not None: append_game(archive_file, initial_state, history)
+                if count % 100 == 0:
+                    writer.flush()
+                    print("Played {} games ({} positions)".format(count, writer.rows - start))
+        finally:
+            if archive_file is not None: archive_file.close()
+        return writer.rows - start
+
+
+def load_dataset(directory=DATASET):
+    """ Return a dict mapping the name of each column of a dataset to a NumPy
+    array (memory-mapped from the column file) with one row per position """
+    import numpy as np
+    rows = dataset_rows(directory)
+    dataset = {}
+    for name, (typecode, width) in COLUMNS.items():
+        dtype = np.dtype(typecode)
+        if rows == 0:
+            dataset[name] = np.empty((0, width) if width > 1 else 0, dtype=dtype)
+            continue
+        column = np.memmap(os.path.join(directory, name), dtype=dtype, mode="r",
+                           shape=(rows * width,))
+        dataset[name] = column.reshape(rows, width) if width > 1 else column
+    return dataset
+
+
+def features(words, ply, locs):
+    """ Return the (N, 5) features of a batch of positions, from the view of
+    the player to move: a bias, the liberties of the player & the opponent,
+    and the liberties scaled by the fraction t of the board played (the
+    (w0, w1) weights of HEURISTICS in my_custom_player) """
+    import numpy as np
+    from isolation.batch import mobilities
+    moves = mobilities(words, locs.astype(np.int64))
+    player = ply % 2
+    rows = np.arange(len(ply))
+    own, opp = moves[rows, player], moves[rows, 1 - player]
+    t = ply / _SIZE
+    return np.column_stack([np.ones(len(ply)), own, own * t, opp, opp * t])
+
+
+def heuristic_features(words, ply, locs, heuristic=HEURISTIC):
+    """ Return the (N, 2) features of a batch of positions for a fit of a
+    heuristic of CustomPlayer (a bias & the score of the player to move) """
+    import numpy as np
+    locs = locs.astype(np.int64)
+    scores = [CustomPlayer(player_id, heuristic=heuristic).score_batch(words, ply, locs)
+              for player_id in (0, 1)]
+    return np.column_stack([np.ones(len(ply)), np.where(ply % 2, scores[1], scores[0])])
+
+
+def batch_heuristics():
+    """ Return the names of the heuristics of CustomPlayer.score_batch(), whose
+    features all have batch evaluators """
+    return sorted(name for name, weights in HEURISTICS.items() if set(weights) <= set(BATCH_FEATURES))
+
+
+def _batches(dataset, make_features, chunk_rows=CHUNK_ROWS):
+    """ Yield the (features, labels) of the dataset, chunk_rows positions at a
+    time; the label is 1 if the player to move won the game """
+    for start in range(0, len(dataset["ply"]), chunk_rows):
+        ply = dataset["ply"][start:start + chunk_rows].astype("int64")
+        words, locs = dataset["words"][start:start + chunk_rows], dataset["locs"][start:start + chunk_rows]
+        yield make_features(words, ply, locs), (dataset["result"][start:start + chunk_rows] == ply % 2)
+
+
+def fit(dataset, make_features=features, chunk_rows=CHUNK_ROWS, iterations=NEWTON_ITERATIONS):
+    """ Fit a logistic model of the probability that the player to move wins
+    to the features of every position, and return the (weights, log loss)
+
+    Each Newton step accumulates the gradient & the Hessian of the log loss
+    over the dataset, chunk_rows positions at a time, so the memory of the
+    fit does not grow with the size of the dataset; the fit converges in a
+    handful of passes over the data.
+    """
+    import numpy as np
+    weights, loss = None, float("nan")
+    for _ in range(iterations):
+        grad = hessian = None
+        loss, rows = 0.0, 0
+        for x, y in _batches(dataset, make_features, chunk_rows):
+            if weights is None: weights = np.zeros(x.shape[1])
+            z = x @ weights
+            p = 1 / (1 + np.exp(-z))
+            g, h = x.T @ (p - y), (x * (p * (1 - p))[:, np.newaxis]).T @ x
+            grad, hessian = (g, h) if grad is None else (grad + g, hessian + h)
+            loss += np.logaddexp(0, z).sum() - z[y].sum()
+            rows += len(y)
+        if grad is None: break
+        # a tiny ridge keeps the Hessian invertible for constant features
+        step = np.linalg.solve(hessian + 1e-9 * rows * np.eye(len(weights)), grad)
+        weights = weights - step
+        if np.abs(step).max() < 1e-6: break
+    return weights, loss / max(rows, 1)
+
+
+def schedule(weights, t):
+    """ Return the offensive weight m of the fitted heuristic (see
+    CustomPlayer.score) when a fraction t of the board is played """
+    _, own, own_t, opp, opp_t = weights
+    own_weight, opp_weight = own + own_t * t, -(opp + opp_t * t)
+    return own_weight / (own_weight + opp_weight)
+
+
+def main(args):
+    if args.command == "play":
+        positions = generate(args.games, args.dataset, args.processes, args.seed, args.depth, args.archive)
+        logger.info("Added {} positions to {}".format(positions, args.dataset))
+        print("Added {} positions to {}".format(positions, args.dataset))
+        return
+    dataset = load_dataset(args.dataset)
+    print("Fitting {} positions".format(len(dataset["ply"])))
+    weights, loss = fit(dataset)
+    baseline, baseline_loss = fit(dataset, partial(heuristic_features, heuristic=args.heuristic))
+    fitted = {"own_moves": tuple(round(float(w), 4) for w in weights[1:3]),
+              "opp_moves": tuple(round(float(w), 4) for w in weights[3:5])}
+    lines = [
+        "Fitted weights: own {:+.4f} {:+.4f} * t, opp {:+.4f} {:+.4f} * t (t = ply / {})".format(
+            *weights[1:], _SIZE),
+        "Fitted heuristic (for HEURISTICS in my_custom_player.py): {}".format(fitted),
+        "Fitted m schedule: " + ", ".join("m({:.2f}) = {:.3f}".format(t, schedule(weights, t))
+                                          for t in (0, 0.25, 0.5, 0.75)),
+        "Log loss: fitted {:.4f}, {} heuristic {:.4f}, no information {:.4f}".format(
+            loss, args.heuristic, baseline_loss, math.log(2)),
+    ]
+    for line in lines:
+        logger.info(line)
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Generate self-play positions & fit the weights of the heuristic of CustomPlayer.",
+        epilog=textwrap.dedent("""\
+            Example Usage:
+            --------------
+            - Play 20000 self-play games (about a million positions) on 4 parallel processes
+              and append their positions to the dataset in the selfplay directory:
+
+                $python selfplay.py play -g 20000 -p 4
+
+            - Fit the weights of the liberties of each player, and their schedule over the
+              game, to the outcomes of every position in the dataset:
+
+                $python selfplay.py fit
+        """)
+    )
+    parser.add_argument(
+        'command', choices=["play", "fit"],
+        help="Generate self-play positions (play), or fit the heuristic weights (fit)."
+    )
+    parser.add_argument(
+        '-i', '--dataset', type=str, default=DATASET,
+        help="Set the directory of the dataset (one file per column)."
+    )
+    parser.add_argument(
+        '-g', '--games', type=int, default=NUM_GAMES,
+        help="Set the number of self-play games to play."
+    )
+    parser.add_argument(
+        '-d', '--depth', type=int, default=SEARCH_DEPTH,
+        help="Set the depth of the search used to choose each self-play move."
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int, default=NUM_PROCS,
+        help="Set the number of parallel processes used to play the games."
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="Set the seed of the random moves of the games (use a new seed to add new games)."
+    )
+    parser.add_argument(
+        '--heuristic', type=str, default=HEURISTIC, choices=batch_heuristics(),
+        help="""\
+            Set the heuristic of CustomPlayer compared with the fitted weights (only the
+            heuristics of the features in BATCH_FEATURES can be scored in batches).
+        """
+    )
+    parser.add_argument(
+        '--archive', type=str,
+        help="Also append the games to this file as compact game records (see isolation.record)."
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(filename="selfplay.log", filemode="a", level=logging.DEBUG)
+    main(args)
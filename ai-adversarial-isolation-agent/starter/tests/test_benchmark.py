@@ -0,0 +1,33 @@
+import unittest
+
+from benchmark import compare, make_corpus, run_benchmarks, tree_size
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_corpus_is_reproducible(self):
+        """ make_corpus() returns the same non-terminal positions for the same seed """
+        corpus = make_corpus(10, seed=1)
+        self.assertEqual(corpus, make_corpus(10, seed=1))
+        self.assertNotEqual(corpus, make_corpus(10, seed=2))
+        self.assertFalse(any(state.terminal_test() for state in corpus))
+
+    def test_tree_size(self):
+        """ tree_size() counts the root & every child down to the depth limit """
+        state = make_corpus(1)[0]
+        children = [state.result(action) for action in state.actions()]
+        self.assertEqual(tree_size(state, 0), 1)
+        self.assertEqual(tree_size(state, 2), 1 + sum(tree_size(c, 1) for c in children))
+
+    def test_run_and_compare(self):
+        """ run_benchmarks() times every benchmark, and compare() reports the
+        benchmarks slower than the baseline """
+        results = run_benchmarks(make_corpus(4), loops=1, repeat=1, search_positions=2,
+                                 alpha_beta_depth=2, minimax_depth=2)
+        self.assertIn("Isolation.actions", results)
+        self.assertGreater(results["CustomPlayer.alpha_beta_search"]["nodes_per_sec"], 0)
+        self.assertGreater(results["CustomPlayer.minimax"]["nodes_per_sec"], 0)
+        baseline = {name: {"ns_per_op": value["ns_per_op"]} for name, value in results.items()}
+        self.assertEqual(compare(results, baseline), [])
+        baseline["Isolation.actions"]["ns_per_op"] /= 2
+        del baseline["Isolation.result"]
+        self.assertEqual(compare(results, baseline), ["Isolation.actions"])
@@ -0,0 +1,334 @@
+
+import os
+import pickle
+import tempfile
+import time
+import unittest
+
+from queue import Empty
+from unittest import mock
+from random import Random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from isolation import Isolation, ActionSlot, AgentWorker, SearchBoard, SearchBudget, fork_get_action
+from isolation.book import OpeningBook, load_book, write_book
+from isolation.endgame import longest_path, reachable, solve_endgame
+from isolation.record import GameArchive, Replay, append_game, decode_game, encode_game
+from isolation.isolation import Action
+from sample_players import BasePlayer, GreedyPlayer
+
+
+class SilentPlayer(BasePlayer):
+    def get_action(self, state):
+        pass
+
+
+class EndlessPlayer(BasePlayer):
+    """ Player that ignores the budget, and only stops when it is cut off """
+    def get_action(self, state):
+        while True:
+            self.queue.put(state.actions()[0])
+            time.sleep(0.01)
+
+
+class HungPlayer(BasePlayer):
+    """ Player that never calls queue.put() again after its first action """
+    def get_action(self, state):
+        self.queue.put(state.actions()[0])
+        while True: time.sleep(1)
+
+
+class CountingContext:
+    """ Context with a large payload that stays in the worker, and a move
+    counter sent to the parent as a delta """
+    def __init__(self):
+        self.moves = 0
+        self.payload = None
+
+    def delta(self):
+        return self.moves
+
+    def apply_delta(self, moves):
+        self.moves = moves
+
+
+class CountingPlayer(GreedyPlayer):
+    def get_action(self, state):
+        if self.context is None: self.context = CountingContext()
+        self.context.moves += 1
+        if self.context.moves > 1: self.context.payload = list(range(10000))
+        super().get_action(state)
+
+
+class IsolationMoveTableTest(unittest.TestCase):
+    def test_actions_match_knight_steps(self):
+        """ actions() & liberties() agree with stepping through every Action """
+        rng = Random(0)
+        state = Isolation().result(57).result(0)
+        while not state.terminal_test():
+            for loc in state.locs:
+                expected = [loc + a for a in Action if loc + a >= 0 and state.board & (1 << (loc + a))]
+                self.assertEqual(state.liberties(loc), expected)
+            loc = state.locs[state.player()]
+            self.assertEqual(state.actions(), [c - loc for c in state.liberties(loc)])
+            self.assertEqual(state.both_mobilities(),
+                             tuple(len(state.liberties(l)) for l in state.locs))
+            state = state.result(rng.choice(state.actions()))
+
+
+class SearchBoardTest(unittest.TestCase):
+    def test_make_unmake_round_trip(self):
+        """ SearchBoard.make() & unmake() track Isolation.result() through a game """
+        rng = Random(1)
+        state = Isolation()
+        board = SearchBoard.from_state(state)
+        history = [state]
+        while not state.terminal_test():
+            action = rng.choice(state.actions())
+            state = state.result(action)
+            board.make(action)
+            history.append(state)
+            self.assertEqual(board.to_state(), state)
+            self.assertEqual(board.actions(), state.actions())
+            self.assertEqual(board.both_mobilities(), state.both_mobilities())
+        self.assertEqual(board.utility(0), state.utility(0))
+        while len(history) > 1:
+            board.unmake()
+            history.pop()
+            self.assertEqual(board.to_state(), history[-1])
+
+
+class CanonicalTest(unittest.TestCase):
+    def _mirror_cell(self, cell, transform):
+        x, y = cell % 13, cell // 13
+        if transform & 1: x = 10 - x
+        if transform & 2: y = 8 - y
+        return x + 13 * y
+
+    def test_mirror_images_share_canonical_key(self):
+        """ canonical(), transform() & transform_action() agree with mirroring each cell """
+        rng = Random(3)
+        state = Isolation()
+        while not state.terminal_test():
+            key, transform = state.canonical()
+            for t in range(4):
+                image = state.transform(t)
+                open_cells = [c for c in range(115) if state.board & (1 << c)]
+                self.assertEqual(image.board, sum(1 << self._mirror_cell(c, t) for c in open_cells))
+                self.assertEqual(image.transform(t), state)
+                self.assertEqual(image.canonical()[0], key)
+                for action in state.actions():
+                    self.assertEqual(image.result(state.transform_action(action, t)),
+                                     state.result(action).transform(t))
+            self.assertEqual(state.transform(transform).canonical(), (key, 0))
+            state = state.result(rng.choice(state.actions()))
+
+
+class OpeningBookTest(unittest.TestCase):
+    def test_book_file_matches_dict(self):
+        """ A book file maps every canonical key of the book dict to its action """
+        rng = Random(5)
+        book = {}
+        for _ in range(300):
+            state = Isolation()
+            for _ in range(rng.randrange(5)):
+                state = state.result(rng.choice(state.actions()))
+            if not state.terminal_test():
+                book[state.canonical()[0]] = rng.choice(state.transform(state.canonical()[1]).actions())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "data.book")
+            write_book(book, filename)
+            data = load_book(filename)
+            self.assertIsInstance(data, OpeningBook)
+            self.assertEqual(dict(data), book)
+            self.assertEqual(len(data), len(book))
+            for key, action in book.items():
+                self.assertEqual(data[key], action)
+                self.assertIsNone(data.get(key + 1 if key + 1 not in book else -1))
+            # the book is mapped once per process, and pickled by file name
+            self.assertIs(load_book(filename), data)
+            self.assertIs(pickle.loads(pickle.dumps(data)), data)
+
+            filename = os.path.join(tmpdir, "data.pickle")
+            with open(filename, "wb") as f: pickle.dump(book, f)
+            with self.assertRaises(ValueError):
+                OpeningBook(filename)
+
+
+class GameRecordTest(unittest.TestCase):
+    def _random_games(self, rng, count):
+        for _ in range(count):
+            # start some games from a state after the opening, like fair matches
+            state = Isolation()
+            for _ in range(rng.choice((0, 2, 3))): state = state.result(rng.choice(state.actions()))
+            initial_state, history, states = state, [], [state]
+            while not state.terminal_test():
+                history.append(rng.choice(state.actions()))
+                state = state.result(history[-1])
+                states.append(state)
+            yield initial_state, history, states
+
+    def test_replay_matches_isolation(self):
+        """ Records round trip, and Replay.state() agrees with Isolation.result() at every ply """
+        rng = Random(4)
+        for initial_state, history, states in self._random_games(rng, 20):
+            record = encode_game(initial_state, history)
+            self.assertEqual(len(record), 18 + len(history))
+            self.assertEqual(decode_game(record), (initial_state, history))
+            self.assertEqual([type(action) for action in decode_game(record)[1]],
+                             [type(action) for action in history])
+            replay = Replay(initial_state, history, interval=rng.choice((1, 3, 8)))
+            self.assertEqual(len(replay), len(history))
+            for state in states:
+                self.assertEqual(replay.state(state.ply_count), state)
+            with self.assertRaises(IndexError):
+                replay.state(states[-1].ply_count + 1)
+
+    def test_archive(self):
+        """ GameArchive reads back every game appended to an archive file """
+        games = list(self._random_games(Random(6), 10))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "games")
+            with open(filename, "wb") as f:
+                for initial_state, history, _ in games:
+                    append_game(f, initial_state, history)
+            archive = GameArchive.load(filename)
+        self.assertEqual(len(archive), len(games))
+        for index, (initial_state, history, states) in enumerate(games):
+            self.assertEqual(archive[index], (initial_state, history))
+            self.assertEqual(archive.state(index, states[-1].ply_count), states[-1])
+        self.assertIs(archive.replay(0), archive.replay(0))
+        # a record cut short at the end of the archive is ignored
+        self.assertEqual(len(GameArchive(archive.data[:-1])), len(games) - 1)
+
+
+class EndgameTest(unittest.TestCase):
+    def _reachable(self, state, loc):
+        region, frontier = 0, [loc]
+        while frontier:
+            for cell in state.liberties(frontier.pop()):
+                if not region & (1 << cell):
+                    region |= 1 << cell
+                    frontier.append(cell)
+        return region
+
+    def _longest_path(self, board, loc):
+        targets = [loc + a for a in Action if loc + a >= 0 and board & (1 << (loc + a))]
+        return max((1 + self._longest_path(board ^ (1 << t), t) for t in targets), default=0)
+
+    def test_endgame_matches_exhaustive_search(self):
+        """ reachable(), longest_path() & solve_endgame() agree with exhaustive search """
+        rng = Random(2)
+        separated = 0
+        for _ in range(30):
+            state = Isolation()
+            for _ in range(2): state = state.result(rng.choice(state.actions()))
+            while not state.terminal_test():
+                self.assertEqual([reachable(state.board, loc) for loc in state.locs],
+                                 [self._reachable(state, loc) for loc in state.locs])
+                # close all but a few random cells to get small endgames
+                cells = rng.sample([c for c in range(115) if state.board & (1 << c)], 16)
+                endgame = Isolation(board=sum(1 << c for c in cells),
+                                    ply_count=state.ply_count, locs=state.locs)
+                regions = [reachable(endgame.board, loc) for loc in endgame.locs]
+                lengths = [self._longest_path(r, loc) for r, loc in zip(regions, endgame.locs)]
+                for region, loc, length in zip(regions, endgame.locs, lengths):
+                    self.assertEqual(longest_path(region, loc)[:2], (length, length))
+                expected = None
+                if not regions[0] & regions[1]:
+                    active = endgame.player()
+                    expected = active if lengths[active] > lengths[1 - active] else 1 - active
+                    separated += 1
+                self.assertEqual(solve_endgame(endgame), expected)
+                state = state.result(rng.choice(state.actions()))
+        self.assertGreater(separated, 0)
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class BatchTest(unittest.TestCase):
+    def test_matches_isolation(self):
+        """ mobilities() & terminal() agree with Isolation on random states """
+        from isolation.batch import mobilities, pack_states, terminal
+        rng = Random(0)
+        states = []
+        for _ in range(20):
+            state = Isolation()
+            while not state.terminal_test():
+                states.append(state)
+                state = state.result(rng.choice(state.actions()))
+            states.append(state)
+        words, ply_counts, locs = pack_states(states)
+        self.assertEqual(words.shape, (len(states), 2))
+        self.assertEqual(ply_counts.tolist(), [state.ply_count for state in states])
+        self.assertEqual(mobilities(words, locs).tolist(),
+                         [list(state.both_mobilities()) for state in states])
+        self.assertEqual(terminal(words, locs).tolist(), [state.terminal_test() for state in states])
+
+
+class AgentWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.time_limit = 150
+        self.state = Isolation().result(57).result(0)
+
+    def test_worker_reused_between_moves(self):
+        """ AgentWorker answers several requests from one long-lived process """
+        with AgentWorker(GreedyPlayer(0)) as worker:
+            pid = worker._process.pid
+            for _ in range(3):
+                action = worker.get_action(self.state, self.time_limit)
+                self.assertIn(action, self.state.actions())
+            self.assertEqual(pid, worker._process.pid)
+
+    def test_context_kept_in_worker(self):
+        """ AgentWorker keeps the context in the worker between moves and
+        applies its deltas to the copy of the parent """
+        agent = CountingPlayer(0)
+        with AgentWorker(agent) as worker:
+            for moves in range(1, 4):
+                self.assertIn(worker.get_action(self.state, self.time_limit), self.state.actions())
+                self.assertEqual(agent.context.moves, moves)
+            # the payload was added after the first move, which sent a copy of the context
+            self.assertIsNone(agent.context.payload)
+            # a context replaced by the parent is sent to the worker
+            agent.context = CountingContext()
+            worker.get_action(self.state, self.time_limit)
+            self.assertEqual(agent.context.moves, 1)
+
+    def test_action_slot(self):
+        """ ActionSlot returns the last action put since it was cleared """
+        slot = ActionSlot()
+        with self.assertRaises(Empty):
+            slot.get()
+        for action in self.state.actions():
+            slot.put(action)
+        self.assertEqual(slot.get(), self.state.actions()[-1])
+        self.assertIs(type(slot.get()), Action)
+        slot.put(None)
+        self.assertIsNone(slot.get())
+        with self.assertRaises(ValueError):
+            slot.put(list(range(1000)))
+        self.assertIsNone(slot.get())
+        slot.clear()
+        self.assertTrue(slot.empty())
+
+    def test_budget_timeout(self):
+        """ Agents that ignore the budget are stopped after the timeout of the budget,
+        and killed if they do not stop """
+        budget = SearchBudget(depth=1, timeout=0.2)
+        with mock.patch("isolation.PROCESS_TIMEOUT", 0.5):
+            for agent in (EndlessPlayer(0), HungPlayer(0)):
+                self.assertEqual(fork_get_action(self.state, agent, None, budget=budget),
+                                 self.state.actions()[0])
+            for agent in (EndlessPlayer(0), HungPlayer(0)):
+                with AgentWorker(agent) as worker:
+                    self.assertEqual(worker.get_action(self.state, None, budget), self.state.actions()[0])
+
+    def test_worker_raises_empty_without_action(self):
+        """ AgentWorker raises queue.Empty if the agent never calls queue.put() """
+        with AgentWorker(SilentPlayer(0)) as worker:
+            with self.assertRaises(Empty):
+                worker.get_action(self.state, self.time_limit)
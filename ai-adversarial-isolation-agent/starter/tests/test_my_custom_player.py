@@ -1,13 +1,27 @@
 
+import os
+import pickle
+import tempfile
 import unittest
 
 from collections import deque
-from random import choice
+from random import Random, choice
 from textwrap import dedent
+from unittest import mock
 
-from isolation import Isolation, Agent, fork_get_action, play, DebugState
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from isolation import Isolation, Agent, SearchBoard, SearchBudget, fork_get_action, play, DebugState
+from isolation.book import OpeningBook, write_book
+from isolation.endgame import reachable, separated
+from isolation.isolation import Action
 from sample_players import RandomPlayer
-from my_custom_player import CustomPlayer
+from build_opening_book import build_book
+from my_custom_player import (BATCH_FEATURES, HEURISTICS, CustomPlayer, SharedTranspositionTable,
+                              TranspositionTable, compile_heuristic, zobrist_key, zobrist_child_key)
 
 
 class BaseCustomPlayerTest(unittest.TestCase):
@@ -48,6 +62,54 @@ class CustomPlayerGetActionTest(BaseCustomPlayerTest):
         self._test_state(self.terminal_state)
 
 
+class ListQueue(list):
+    def put(self, item): self.append(item)
+
+
+class IterativeDeepeningTest(BaseCustomPlayerTest):
+    def test_depth_limit(self):
+        """ get_action() stops deepening at depth_limit when there is no timer """
+        agent = CustomPlayer(self.move_2_state.player(), depth_limit=3)
+        agent.queue = ListQueue()
+        agent.get_action(self.move_2_state)
+        self.assertEqual(len(agent.queue), 3)
+
+    def test_budget(self):
+        """ get_action() stops deepening when the node or depth budget of the
+        queue runs out, and repeats the same search for the same budget """
+        agent = CustomPlayer(self.move_2_state.player())
+        agent.queue = ListQueue()
+        agent.queue.budget = SearchBudget(depth=2)
+        agent.get_action(self.move_2_state)
+        self.assertEqual(len(agent.queue), 2)
+
+        searches = []
+        for _ in range(2):
+            agent = CustomPlayer(self.move_2_state.player(), node_limit=3000)
+            agent.queue = ListQueue()
+            agent.get_action(self.move_2_state)
+            searches.append((list(agent.queue), agent.stats.nodes))
+        self.assertEqual(searches[0], searches[1])
+        self.assertLess(searches[0][1], 3000 + 256)
+
+    def test_stops_on_proven_result(self):
+        """ get_action() stops deepening once the score proves a win or loss """
+        # each player has one move left, after which player 1 is stuck; all
+        # other open cells are out of reach of both players
+        locs, targets = (57, 2), (57 + Action.NNE, 2 + Action.NNW)
+        blank = Isolation()
+        unreachable = set(locs) | set(targets)
+        for loc in locs + targets: unreachable.update(blank.liberties(loc))
+        board = sum(1 << c for c in blank.liberties(None) if c not in unreachable)
+        board |= (1 << targets[0]) | (1 << targets[1])
+        state = Isolation(board=board, ply_count=2, locs=locs)
+
+        agent = CustomPlayer(state.player())
+        agent.queue = ListQueue()
+        agent.get_action(state)
+        self.assertEqual(agent.queue, [Action.NNE])
+
+
 class CustomPlayerPlayTest(BaseCustomPlayerTest):
     def test_custom_player(self):
         """ CustomPlayer successfully completes a game against itself """
@@ -67,3 +129,251 @@ class CustomPlayerPlayTest(BaseCustomPlayerTest):
                        
             raise Exception("Your agent did not play until a terminal state.")
 
+
+class TranspositionTableTest(BaseCustomPlayerTest):
+    def test_incremental_zobrist_key(self):
+        """ zobrist_child_key() matches the key computed from scratch """
+        state = self.move_0_state
+        key = zobrist_key(state)
+        while not state.terminal_test():
+            action = choice(state.actions())
+            key = zobrist_child_key(key, state, action)
+            state = state.result(action)
+            self.assertEqual(key, zobrist_key(state))
+
+    def test_table_carried_in_context(self):
+        """ The transposition table is passed between moves through self.context """
+        agent = CustomPlayer(self.move_2_state.player())
+        fork_get_action(self.move_2_state, agent, self.time_limit)
+        self.assertIsInstance(agent.context.tt, TranspositionTable)
+        self.assertTrue(any(agent.context.tt.slots))
+
+    def test_stats_carried_in_context(self):
+        """ The search stats of the last move are passed through self.context """
+        agent = CustomPlayer(self.move_2_state.player())
+        fork_get_action(self.move_2_state, agent, self.time_limit)
+        stats = agent.context.stats
+        self.assertGreater(stats.depth, 0)
+        self.assertEqual(len(stats.iteration_times), stats.depth)
+        self.assertGreater(stats.nodes, stats.leaves)
+        self.assertGreater(sum(stats.cutoffs), 0)
+
+
+class ParallelSearchTest(BaseCustomPlayerTest):
+    def test_shared_table_matches_table(self):
+        """ SharedTranspositionTable stores & looks up the same entries as TranspositionTable """
+        rng = Random(0)
+        tables = [TranspositionTable(2**12), SharedTranspositionTable(2**12)]
+        attached = SharedTranspositionTable(buffer=tables[1].buffer)
+        for age in range(3):
+            for table in tables: table.new_search()
+            attached.age = tables[1].age
+            for _ in range(500):
+                key, depth = rng.getrandbits(64) & 0xfff0f, rng.randrange(10)
+                alpha, beta = sorted(rng.uniform(-5, 5) for _ in range(2))
+                value, bound = rng.choice([float("-inf"), -1.5, 0., 2.25, float("inf")]), rng.randrange(3)
+                move = rng.choice([None, 0, 114] + list(Action))
+                self.assertEqual(tables[0].lookup(key, depth, alpha, beta),
+                                 attached.lookup(key, depth, alpha, beta))
+                for table in (tables[0], attached if age % 2 else tables[1]):
+                    table.store(key, depth, value, bound, move)
+
+        # a slot overwritten by two processes at once reads as empty
+        key = 12345
+        tables[1].store(key, 3, 1.0, tables[1].EXACT, Action.NNE)
+        self.assertEqual(tables[1].lookup(key, 3, 0, 2), (1.0, Action.NNE))
+        tables[1].values[3 * (key & tables[1].mask) + 1] = 2.0
+        self.assertEqual(tables[1].lookup(key, 3, 0, 2), (None, None))
+
+    def test_parallel_search(self):
+        """ get_action() publishes a legal move with helper processes, and
+        keeps the shared table out of self.context """
+        state = self.move_2_state
+        agent = CustomPlayer(state.player(), helpers=2)
+        action = fork_get_action(state, agent, self.time_limit)
+        self.assertIn(action, state.actions())
+        self.assertIsNone(agent.context.tt)
+        self.assertGreater(agent.context.stats.depth, 0)
+
+        agent = CustomPlayer(state.player(), helpers=2, depth_limit=4)
+        agent.queue = ListQueue()
+        agent.get_action(state)
+        self.assertIn(agent.queue[-1], state.actions())
+        self.assertEqual([p.is_alive() for p in agent.smp.processes], [True, True])
+        self.assertTrue(agent.smp.stop_signal.is_set())
+
+        # an illegal move read from the shared table is not published
+        entry = (99, 1.0, agent.tt.EXACT, 0)  # a placement, once both players are placed
+        agent.queue = ListQueue()
+        with mock.patch.object(agent.tt, "entry", return_value=entry):
+            agent.get_action(state)
+        self.assertTrue(agent.queue)
+        self.assertTrue(all(action in state.actions() for action in agent.queue))
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class ScoreBatchTest(BaseCustomPlayerTest):
+    def test_matches_score(self):
+        """ score_batch() returns the score() of every state in the batch """
+        from isolation.batch import pack_states
+        states = [self.move_2_state]
+        while not states[-1].terminal_test():
+            states.append(states[-1].result(choice(states[-1].actions())))
+        for name, weights in HEURISTICS.items():
+            if not set(weights) <= set(BATCH_FEATURES):
+                with self.assertRaises(ValueError):
+                    CustomPlayer(0, heuristic=name).score_batch(*pack_states(states))
+                continue
+            for player_id in (0, 1):
+                agent = CustomPlayer(player_id, heuristic=name)
+                scores = agent.score_batch(*pack_states(states))
+                np.testing.assert_allclose(scores, [agent.score(state) for state in states])
+
+
+class HeuristicTest(BaseCustomPlayerTest):
+    def _features(self, state, player_id):
+        own_loc, opp_loc = state.locs[player_id], state.locs[1 - player_id]
+
+        def moves2(loc):
+            return sum(state.mobility_at(cell) for cell in state.liberties(loc))
+
+        def center(loc):
+            return 0 if loc is None else (loc % 13 - 5) ** 2 + (loc // 13 - 4) ** 2
+
+        partition = 0
+        if None not in state.locs and separated(state.board, own_loc, opp_loc):
+            own_cells, opp_cells = (reachable(state.board, loc).bit_count() for loc in (own_loc, opp_loc))
+            partition = (own_cells > opp_cells) - (own_cells < opp_cells)
+        return {"own_moves": state.mobility_at(own_loc), "opp_moves": state.mobility_at(opp_loc),
+                "own_moves2": moves2(own_loc), "opp_moves2": moves2(opp_loc),
+                "own_center": center(own_loc), "opp_center": center(opp_loc), "partition": partition}
+
+    def test_compiled_heuristics(self):
+        """ Compiled heuristics return the weighted sum of their features """
+        rng = Random(8)
+        states = [self.move_0_state, self.move_1_state]
+        for _ in range(5):
+            state = Isolation()
+            while not state.terminal_test():
+                states.append(state)
+                state = state.result(rng.choice(state.actions()))
+        for name, weights in HEURISTICS.items():
+            for player_id in (0, 1):
+                agent = CustomPlayer(player_id, heuristic=name)
+                for state in states:
+                    features, t = self._features(state, player_id), state.ply_count / 115
+                    expected = sum((weight[0] + weight[1] * t if isinstance(weight, tuple) else weight)
+                                   * features[feature] for feature, weight in weights.items())
+                    self.assertAlmostEqual(agent.score(state), expected)
+                    self.assertEqual(agent.score(SearchBoard.from_state(state)), agent.score(state))
+        # the dynamic heuristic scores exactly like the m schedule it replaces
+        agent = CustomPlayer(1)
+        for state in states:
+            m = state.ply_count / 115
+            own_moves, opp_moves = state.both_mobilities()[::-1]
+            self.assertEqual(agent.score(state), m * own_moves - (1 - m) * opp_moves)
+
+    def test_heuristic_choice(self):
+        """ CustomPlayer compiles its heuristic once, from a name or a dict of weights """
+        state = self.move_2_state
+        agent = CustomPlayer(0, heuristic={"own_moves": 2})
+        self.assertEqual(agent.score(state), 2 * state.mobility(0))
+        self.assertIs(agent.evaluate, compile_heuristic({"own_moves": 2}, 0))
+        copy = pickle.loads(pickle.dumps(CustomPlayer(1, heuristic="lookahead")))
+        self.assertEqual(copy.score(state), CustomPlayer(1, heuristic="lookahead").score(state))
+        with self.assertRaises(ValueError):
+            CustomPlayer(0, heuristic="unknown")
+        with self.assertRaises(ValueError):
+            CustomPlayer(0, heuristic={"unknown": 1})
+
+
+class CountingPlayer(CustomPlayer):
+    def __init__(self, player_id):
+        super().__init__(player_id)
+        self.leaves = 0
+
+    def score(self, state):
+        self.leaves += 1
+        return super().score(state)
+
+
+class AlphaBetaSearchTest(BaseCustomPlayerTest):
+    def _minimax_value(self, agent, state, depth):
+        if state.terminal_test(): return state.utility(agent.player_id)
+        if depth <= 0: return CustomPlayer.score(agent, state)
+        values = [self._minimax_value(agent, state.result(a), depth - 1) for a in state.actions()]
+        return max(values) if state.player() == agent.player_id else min(values)
+
+    def _count_leaves(self, state, depth):
+        if state.terminal_test(): return 0
+        if depth <= 0: return 1
+        return sum(self._count_leaves(state.result(a), depth - 1) for a in state.actions())
+
+    def test_alpha_beta_matches_minimax(self):
+        """ alpha_beta_search() finds a minimax-optimal move with fewer leaf evaluations """
+        depth = 3
+        state = Isolation().result(57).result(60)
+        agent = CountingPlayer(state.player())
+        for d in range(1, depth):
+            agent.alpha_beta_search(state, d)
+        agent.leaves = 0
+        action = agent.alpha_beta_search(state, depth)
+        values = {a: self._minimax_value(agent, state.result(a), depth - 1) for a in state.actions()}
+        self.assertEqual(values[action], max(values.values()))
+        self.assertLess(agent.leaves, self._count_leaves(state, depth))
+
+    def test_pvs_matches_alpha_beta(self):
+        """ Aspiration windows & PVS find the same score as a full-window search """
+        depth = 4
+        state = self.move_2_state
+        agent = CustomPlayer(state.player())
+        score = None
+        for d in range(1, depth + 1):
+            score, action = agent.aspiration_search(state, d, score)
+        baseline = CustomPlayer(state.player(), aspiration_window=None, pvs=False)
+        self.assertEqual(score, baseline.search(state, depth)[0])
+
+
+class OpeningBookTest(BaseCustomPlayerTest):
+    def test_book_move_played(self):
+        """ get_action() plays the book move of the canonical image of the state """
+        state = self.move_2_state
+        key, transform = state.canonical()
+        action = state.actions()[-1]
+        agent = CustomPlayer(state.player())
+        agent.data = {key: state.transform_action(action, transform)}
+        agent.queue = ListQueue()
+        agent.get_action(state)
+        self.assertEqual(agent.queue, [action])
+
+    def test_book_file_loaded(self):
+        """ CustomPlayer maps data.book from the working directory and plays its moves """
+        state = self.move_2_state
+        key, transform = state.canonical()
+        action = state.actions()[-1]
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            write_book({key: state.transform_action(action, transform)}, os.path.join(tmpdir, "data.book"))
+            os.chdir(tmpdir)
+            try:
+                agent, other = CustomPlayer(state.player()), CustomPlayer(1 - state.player())
+            finally:
+                os.chdir(cwd)
+            self.assertIsInstance(agent.data, OpeningBook)
+            self.assertIs(other.data, agent.data)  # loaded once per process
+            agent.queue = ListQueue()
+            agent.get_action(state)
+            self.assertEqual(agent.queue, [action])
+
+    def test_book_covers_opponent_replies(self):
+        """ build_book() stores a legal move for every state the player can face """
+        agent = CustomPlayer(0)
+        agent.data = build_book(num_plies=3, depth=1, num_processes=1)
+        first_move = agent.book_action(Isolation())
+        self.assertIn(first_move, Isolation().actions())
+        for action in Isolation().actions():
+            state = Isolation().result(action)
+            self.assertIn(agent.book_action(state), state.actions())
+        for action in Isolation().result(first_move).actions():
+            state = Isolation().result(first_move).result(action)
+            self.assertIn(agent.book_action(state), state.actions())
@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+import unittest
+
+from argparse import Namespace
+
+from isolation import Isolation, Agent, SearchBudget
+from isolation.record import GameArchive
+from sample_players import RandomPlayer, GreedyPlayer
+from my_custom_player import CustomPlayer
+from run_match import Match, MatchLog, SPRT, play_sprt, _run_matches, _stream_matches
+
+
+class StreamMatchesTest(unittest.TestCase):
+    def setUp(self):
+        agents = (Agent(GreedyPlayer, "Greedy Agent"), Agent(RandomPlayer, "Random Agent"))
+        self.matches = [Match(players=agents, initial_state=Isolation(), time_limit=150,
+                              match_id=i, debug_flag=False) for i in range(4)]
+
+    def test_all_matches_played(self):
+        """ _stream_matches() yields one result for every match from the process pool """
+        records = list(_stream_matches(self.matches, num_processes=2))
+        self.assertEqual(sorted(record.match_id for record in records), [0, 1, 2, 3])
+        for record in records:
+            self.assertIn(record.winner.name, ("Greedy Agent", "Random Agent"))
+            self.assertEqual(len(record.history), len(record.move_times))
+            # the sample players do not report search stats
+            self.assertEqual(record.search_stats, [None] * len(record.history))
+
+    def test_stop_early(self):
+        """ _stream_matches() can be abandoned before every game has finished """
+        stream = _stream_matches(self.matches, num_processes=1)
+        record = next(stream)
+        stream.close()
+        self.assertIn(record.winner.name, ("Greedy Agent", "Random Agent"))
+
+
+    def test_budget_is_reproducible(self):
+        """ Games with a node budget & a seed are replayed move for move """
+        agents = (Agent(CustomPlayer, "Custom Agent"), Agent(RandomPlayer, "Random Agent"))
+        budget = SearchBudget(nodes=1000, seed=7)
+        matches = [Match(players=agents, initial_state=Isolation(), time_limit=1,
+                         match_id=i, debug_flag=False, budget=budget) for i in range(2)]
+        first, second = list(_stream_matches(matches, num_processes=1))
+        self.assertEqual(first.history, second.history)
+        # the budget replaces the 1 ms time limit
+        self.assertEqual(first.status.name, "GAME_OVER")
+        custom_stats = [stats for stats in first.search_stats if stats is not None]
+        self.assertTrue(all(stats["nodes"] < 1000 + 256 for stats in custom_stats))
+
+
+class MatchLogTest(StreamMatchesTest):
+    def test_resume_skips_finished_games(self):
+        """ _run_matches() logs every game & skips the games in the log on resume """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "matches.jsonl")
+            log = MatchLog(filename)
+            results = _run_matches(self.matches, "Greedy Agent", num_processes=1, log=log)
+            log.close()
+            with open(filename) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 4)
+            entry = json.loads(lines[0])
+            self.assertEqual(len(entry["history"]), len(entry["move_times"]))
+            self.assertEqual(entry["status"], "GAME_OVER")
+            # simulate a run interrupted while writing the last game
+            with open(filename, "w") as f:
+                f.writelines(lines[:-1] + [lines[-1][:10]])
+
+            log = MatchLog(filename, resume=True)
+            self.assertEqual(len(log.finished), 3)
+            resumed = _run_matches(self.matches, "Greedy Agent", num_processes=1, log=log)
+            log.close()
+            self.assertEqual(sorted(r.match_id for r in resumed), sorted(r.match_id for r in results))
+            with open(filename) as f:
+                lines = f.readlines()
+            self.assertEqual(lines[-2], lines[-2][:10] + "\n")  # the incomplete line is skipped
+            self.assertEqual(sorted(json.loads(line)["match_id"] for line in lines if line != lines[-2]),
+                             [0, 1, 2, 3])
+
+
+    def test_archive(self):
+        """ MatchLog appends a compact record of every game to the archive, in log order """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename, archive = os.path.join(tmpdir, "matches.jsonl"), os.path.join(tmpdir, "matches.games")
+            log = MatchLog(filename, archive=archive)
+            _run_matches(self.matches[:2], "Greedy Agent", num_processes=1, log=log)
+            log.close()
+            # simulate a run interrupted while writing the last record
+            with open(archive, "ab") as f: f.write(b"\x20\x00\xff")
+            log = MatchLog(filename, resume=True, archive=archive)
+            _run_matches(self.matches, "Greedy Agent", num_processes=1, log=log)
+            log.close()
+            with open(filename) as f:
+                entries = [json.loads(line) for line in f]
+            games = GameArchive.load(archive)
+            self.assertEqual(len(games), 4)
+            for entry, (initial_state, history) in zip(entries, games):
+                self.assertEqual(initial_state, Isolation())
+                self.assertEqual(history, entry["history"])
+
+
+    def test_search_stats(self):
+        """ MatchLog aggregates the search stats of each agent, also on resume """
+        agents = (Agent(CustomPlayer, "Custom Agent"), Agent(RandomPlayer, "Random Agent"))
+        matches = [Match(players=agents, initial_state=Isolation(), time_limit=100,
+                         match_id=0, debug_flag=False)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "matches.jsonl")
+            log = MatchLog(filename)
+            _run_matches(matches, "Custom Agent", num_processes=1, log=log)
+            log.close()
+            self.assertEqual(list(log.search_stats), ["Custom Agent"])
+            summary = log.search_stats["Custom Agent"]
+            self.assertGreater(summary.moves, 0)
+            self.assertGreater(summary.nodes_per_second(), 0)
+
+            resumed = MatchLog(filename, resume=True)
+            resumed.close()
+            self.assertEqual(str(resumed.search_stats["Custom Agent"]), str(summary))
+
+
+class SPRTTest(unittest.TestCase):
+    def test_decisions(self):
+        """ SPRT accepts elo1 for a much stronger agent & elo0 for an equal agent """
+        strong, equal = SPRT(0, 20), SPRT(0, 20)
+        self.assertIsNone(strong.decision())
+        for i in range(1000):
+            strong.add_pair(2 if i % 3 else 1)
+            equal.add_pair((0, 1, 1, 2)[i % 4])
+        self.assertEqual(strong.decision(), 20)
+        self.assertEqual(equal.decision(), 0)
+        self.assertAlmostEqual(equal.elo(), 0)
+
+    def test_play_sprt_stops_early(self):
+        """ play_sprt() plays pairs of fair matches until the test accepts a hypothesis """
+        custom_agent, test_agent = Agent(GreedyPlayer, "Greedy Agent"), Agent(RandomPlayer, "Random Agent")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = Namespace(sprt=(0, 100), alpha=0.05, beta=0.05, rounds=200, time_limit=150,
+                             debug=False, processes=2, resume=False, nodes=None, depth=None, seed=None,
+                             budget_timeout=None, archive=None, log=os.path.join(tmpdir, "matches.jsonl"))
+            sprt, wins, num_games, search_stats = play_sprt(custom_agent, test_agent, args)
+            self.assertEqual(sprt.decision(), 100)
+            self.assertLess(num_games, 2 * args.rounds)
+            with open(args.log) as f:
+                match_ids = [json.loads(line)["match_id"] for line in f]
+            # the games still running at the decision are logged without being counted
+            self.assertLessEqual(num_games, len(match_ids))
+            self.assertLess(len(match_ids), num_games + args.processes)
+            self.assertEqual(len(set(match_ids)), len(match_ids))
+            # every pair of a game & its fair replay was counted
+            self.assertGreaterEqual(2 * sum(sprt.pairs), num_games - args.processes)
@@ -0,0 +1,80 @@
+import unittest
+
+from random import Random
+
+from isolation import Isolation, SearchBudget, fork_get_action
+from sample_players import MCTS_DEFAULT_PLAYOUTS, MCTS_PLAYOUTS_PER_PLY, MCTSPlayer, MCTSTree
+
+
+class ListQueue(list):
+    def put(self, item): self.append(item)
+
+
+class MCTSPlayerTest(unittest.TestCase):
+    def setUp(self):
+        rng = Random(0)
+        state = Isolation()
+        while state.ply_count < 10:
+            state = state.result(rng.choice(state.actions()))
+        self.state = state
+
+    def _search(self, state, context=None, **kwargs):
+        agent = MCTSPlayer(state.player(), **kwargs)
+        agent.context = context
+        agent.queue = ListQueue()
+        agent.get_action(state)
+        return agent
+
+    def test_playout_limit(self):
+        """ get_action() plays playout_limit playouts and puts the most visited move last """
+        agent = self._search(self.state, playout_limit=500)
+        tree = agent.context
+        self.assertIsInstance(tree, MCTSTree)
+        self.assertEqual(tree.visits[0], 500)
+        self.assertEqual(tree.stats.nodes, 500)
+        self.assertEqual(agent.queue[-1], tree.best_action())
+        self.assertIn(agent.queue[-1], self.state.actions())
+        # every playout through a node continues through one of its children,
+        # except the playout that expanded it
+        for node in range(len(tree)):
+            if tree.children(node):
+                self.assertEqual(sum(tree.visits[c] for c in tree.children(node)),
+                                 tree.visits[node] - 1 if node else tree.visits[node])
+
+    def test_tree_reused(self):
+        """ The subtree of the state after one move of each player is searched further """
+        agent = self._search(self.state, playout_limit=2000)
+        tree = agent.context
+        child = max(tree.children(0), key=tree.visits.__getitem__)
+        grandchild = max(tree.children(child), key=tree.visits.__getitem__)
+        state = self.state.result(tree.action[child]).result(tree.action[grandchild])
+        self.assertEqual(tree.find(state), grandchild)
+
+        agent = self._search(state, context=tree, playout_limit=100)
+        self.assertEqual(agent.context.visits[0], tree.visits[grandchild] + 100)
+        self.assertEqual((agent.context.board, agent.context.locs), (state.board, state.locs))
+
+    def test_node_budget(self):
+        """ The node budget of the queue limits the number of playouts """
+        agent = MCTSPlayer(self.state.player())
+        agent.queue = ListQueue()
+        agent.queue.budget = SearchBudget(nodes=300)
+        agent.get_action(self.state)
+        self.assertEqual(agent.context.visits[0], 300)
+
+    def test_depth_budget(self):
+        """ A depth budget, or no limit at all, caps the number of playouts """
+        agent = MCTSPlayer(self.state.player())
+        agent.queue = ListQueue()
+        agent.queue.budget = SearchBudget(depth=2)
+        agent.get_action(self.state)
+        self.assertEqual(agent.context.visits[0], 2 * MCTS_PLAYOUTS_PER_PLY)
+        agent = self._search(self.state)
+        self.assertEqual(agent.context.visits[0], MCTS_DEFAULT_PLAYOUTS)
+
+    def test_get_action_with_time_limit(self):
+        """ get_action() calls self.queue.put() with a legal move before timeout """
+        agent = MCTSPlayer(self.state.player())
+        action = fork_get_action(self.state, agent, 150)
+        self.assertIn(action, self.state.actions())
+        self.assertGreater(agent.context.stats.nodes, 0)
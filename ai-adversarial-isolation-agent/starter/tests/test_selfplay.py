@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from isolation import Isolation
+from isolation.record import GameArchive, decode_game
+from selfplay import COLUMNS, DatasetWriter, batch_heuristics, dataset_rows, fit, game_positions, generate, load_dataset, play_game
+
+
+class SelfPlayTest(unittest.TestCase):
+    def test_games_are_reproducible(self):
+        """ play_game() replays the same game for the same seed & index """
+        record, winner = play_game(3, seed=1, depth=1)
+        self.assertEqual(play_game(3, seed=1, depth=1), (record, winner))
+        initial_state, history = decode_game(record)
+        state = initial_state
+        for action in history: state = state.result(action)
+        self.assertTrue(state.terminal_test())
+        self.assertEqual(state.utility(winner), float("inf"))
+
+    def test_generate(self):
+        """ generate() appends the positions of every game to each column, and
+        drops the rows of an interrupted run before appending """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory, archive = os.path.join(tmpdir, "selfplay"), os.path.join(tmpdir, "games")
+            positions = generate(4, directory, num_processes=2, depth=1, archive=archive)
+            games = GameArchive.load(archive)
+            self.assertEqual(len(games), 4)
+            self.assertEqual(positions, sum(len(history) - 2 for _, history in games))
+            self.assertEqual(dataset_rows(directory), positions)
+            # simulate a run interrupted while writing a column
+            with open(os.path.join(directory, "words"), "ab") as f: f.write(bytes(8))
+            with DatasetWriter(directory) as writer:
+                self.assertEqual(writer.rows, positions)
+                writer.add(Isolation().result(57).result(0), 1)
+            self.assertEqual(dataset_rows(directory), positions + 1)
+            for name, (typecode, width) in COLUMNS.items():
+                self.assertEqual(os.path.getsize(os.path.join(directory, name)),
+                                 (positions + 1) * width * array(typecode).itemsize)
+
+    def test_batch_heuristics(self):
+        """ Only the heuristics that score_batch() supports can be compared with a fit """
+        self.assertIn("dynamic", batch_heuristics())
+        self.assertNotIn("lookahead", batch_heuristics())
+        self.assertNotIn("territory", batch_heuristics())
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_load_and_fit(self):
+        """ load_dataset() maps the columns of every position, and fit() improves
+        on a model without information, whatever the size of the chunks """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            directory, archive = os.path.join(tmpdir, "selfplay"), os.path.join(tmpdir, "games")
+            generate(20, directory, num_processes=2, depth=1, archive=archive)
+            dataset = load_dataset(directory)
+            positions = [position for initial_state, history in GameArchive.load(archive)
+                         for position in game_positions(initial_state, history, 0)]
+            self.assertEqual(len(dataset["ply"]), len(positions))
+            self.assertEqual(sorted(dataset["ply"].tolist()), sorted(state.ply_count for state, _ in positions))
+            self.assertEqual(sorted(map(tuple, dataset["locs"].tolist())), sorted(state.locs for state, _ in positions))
+
+            weights, loss = fit(dataset, chunk_rows=100)
+            self.assertEqual(len(weights), 5)
+            self.assertLess(loss, np.log(2))
+            # the same fit in a single chunk
+            np.testing.assert_allclose(fit(dataset)[0], weights, rtol=1e-6, atol=1e-9)